@@ -0,0 +1,98 @@
+import multiprocessing
+import os
+import secrets
+import shutil
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from report import create_html, font_files, report_filename
+
+# ---------------------------------------------------------
+# Batch export: many per-patient reports rendered in a process pool into a ZIP
+# ---------------------------------------------------------
+# Records are fed to the pool WINDOW at a time and each rendered report is
+# written to the archive as soon as it comes back, so memory stays bounded by
+# the window, not by the number of patients. Reports link to one shared copy
+# of the font in the archive's fonts/ folder instead of each embedding its own.
+WINDOW = 512
+CHUNKSIZE = 32
+
+# Finished archives are served from disk by Streamlit's static route
+# (app/static/exports/<token>/<name>) rather than read into memory for
+# st.download_button. Each export gets a random token directory; anyone holding
+# the link can fetch it until it is removed, EXPORT_TTL after creation. Every
+# app process sweeps expired exports when it starts and every SWEEP_SECONDS,
+# whether or not anyone exports again.
+EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "exports")
+EXPORT_TTL = 3600
+SWEEP_SECONDS = 300
+
+def sweep_exports(ttl=EXPORT_TTL):
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    cutoff = time.time() - ttl
+    for entry in os.scandir(EXPORT_DIR):
+        try:
+            if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except OSError:
+            pass  # removed by another process's sweep
+
+def start_sweeper():
+    # Call once per process; the thread dies with it
+    def loop():
+        while True:
+            sweep_exports()
+            time.sleep(SWEEP_SECONDS)
+    thread = threading.Thread(target=loop, name="export-sweeper", daemon=True)
+    thread.start()
+    return thread
+
+def new_export(filename):
+    # Returns (path to write, URL to link to)
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    sweep_exports()
+    token = secrets.token_urlsafe(16)
+    os.mkdir(os.path.join(EXPORT_DIR, token))
+    return os.path.join(EXPORT_DIR, token, filename), f"app/static/exports/{token}/{filename}"
+
+def _unique(name, used):
+    # Entry names must differ even on case-insensitive file systems, or unzip keeps only one
+    stem, ext = os.path.splitext(name)
+    candidate, i = name, 1
+    while candidate.lower() in used:
+        i += 1
+        candidate = f"{stem}_{i}{ext}"
+    used.add(candidate.lower())
+    return candidate
+
+def render_one(rec):
+    return report_filename(rec), create_html(rec, linked_fonts=True).encode('utf-8')
+
+def export_zip(records, out, workers=None, on_progress=None):
+    # `records` is any iterable of plain record dicts; `out` a path or binary file
+    workers = workers or os.cpu_count() or 1
+    records = iter(records)
+    n, t0 = 0, time.perf_counter()
+    # spawn: the Streamlit server is multi-threaded, so don't fork it
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=ctx) as pool, \
+            zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zf:
+        used = set()
+        for name, data in font_files():
+            zf.writestr(_unique(name, used), data)
+        while True:
+            window = list(islice(records, WINDOW))
+            if not window:
+                break
+            for name, data in pool.map(render_one, window, chunksize=CHUNKSIZE):
+                zf.writestr(_unique(name, used), data)
+                n += 1
+            if on_progress:
+                elapsed = time.perf_counter() - t0
+                on_progress(n, n / elapsed if elapsed else 0.0)
+    elapsed = time.perf_counter() - t0
+    return {'reports': n, 'seconds': elapsed, 'per_second': n / elapsed if elapsed else 0.0}
@@ -0,0 +1,180 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Never touch the real registry
+os.environ["REGISTRY_DB"] = os.path.join(tempfile.mkdtemp(prefix="app_bench_"), "bench.db")
+
+import streamlit
+from streamlit.testing.v1 import AppTest
+
+from registry_schema import MULTI_KEYS, OPTIONS, OTHER_KEYS, record_defaults
+from report import create_html
+
+# ---------------------------------------------------------
+# Headless benchmarks of app reruns and report rendering (AppTest)
+# ---------------------------------------------------------
+# Every case is timed REPEAT times without tracing, then once more under
+# tracemalloc for allocations (tracing slows Python down, so the two are kept
+# apart). AppTest always performs full-app runs, so widget changes here cost a
+# whole rerun even where the browser would only rerun one fragment: treat the
+# numbers as an upper bound and compare them between versions.
+#
+#   python benchmarks/app_bench.py --out bench.json
+#   python benchmarks/app_bench.py --baseline bench.json   # adds ratios vs. an older run
+APP = os.path.join(ROOT, "streamlit_app.py")
+REPEAT = 10
+TUG_POLLS = 20
+
+# One widget per form section, with two values to flip between
+SECTION_WIDGETS = {
+    'general': ('text_input', 'fname', ["สมชาย ใจดี", "Somchai Jaidee"]),
+    'medical': ('selectbox', 'cause', ["เบาหวาน", "อุบัติเหตุ"]),
+    'rehab': ('radio', 'rehab', ["เคย", "ไม่เคย"]),
+    'prosthesis': ('selectbox', 'socket', [OPTIONS['socket'][-1], OPTIONS['socket'][0]]),
+    'social': ('radio', 'fall', ["มี", "ไม่"]),
+}
+
+def new_app():
+    return AppTest.from_file(APP, default_timeout=60)
+
+def measure(setup, action):
+    # `setup()` returns the state passed to `action(state)`; only `action` is measured
+    times = []
+    for _ in range(REPEAT):
+        state = setup()
+        t0 = time.perf_counter()
+        action(state)
+        times.append(time.perf_counter() - t0)
+    state = setup()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    action(state)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'repeat': REPEAT,
+        'median_ms': 1000 * statistics.median(times),
+        'min_ms': 1000 * min(times),
+        'max_ms': 1000 * max(times),
+        'first_ms': 1000 * times[0],
+        'alloc_peak_kb': (peak - before) / 1024,
+        'alloc_retained_kb': (current - before) / 1024,
+    }
+
+def check(at):
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return at
+
+# ---------------------------------------------------------
+# Cases
+# ---------------------------------------------------------
+def bench_cold_run():
+    # New session: defaults, CSS, every section; process-wide caches stay warm
+    return measure(new_app, lambda at: check(at.run()))
+
+def bench_section(kind, key, values):
+    def setup():
+        at = check(new_app().run())
+        setup.flip = not getattr(setup, 'flip', False)
+        return at, values[0] if setup.flip else values[1]
+
+    def action(state):
+        at, value = state
+        check(getattr(at, kind)(key=key).set_value(value).run())
+    return measure(setup, action)
+
+def bench_tug_cycle():
+    # Server mode: START, TUG_POLLS clock polls, STOP
+    def setup():
+        at = check(new_app().run())
+        return check(at.radio(key="tug_mode").set_value("Server").run())
+
+    def action(at):
+        check(at.button(key="tug_start").click().run())
+        for _ in range(TUG_POLLS):
+            check(at.run())
+        check(at.button(key="tug_stop").click().run())
+        if at.session_state.t1 <= 0:
+            raise RuntimeError("TUG cycle did not record a trial")
+    res = measure(setup, action)
+    res['polls'] = TUG_POLLS
+    return res
+
+def large_record():
+    # Every multiselect fully ticked, every "Other" text long
+    rec = record_defaults()
+    for k in MULTI_KEYS:
+        rec[k] = list(OPTIONS[k])
+    for key, ot in OTHER_KEYS.items():
+        if key not in MULTI_KEYS:
+            rec[key] = "Other"
+        rec[ot] = "รายละเอียดเพิ่มเติม <ระบุ> & 'อื่นๆ' " * 20
+    rec.update(hn="HN0000001", fname="ทดสอบ ระบบรายงาน", tug_avg=14.2, tug_status="⚠️ High Fall Risk")
+    return rec
+
+def bench_create_html(rec, n=50):
+    # Per-report time; n renders per sample so the timer resolution doesn't matter
+    res = measure(lambda: rec, lambda r: [create_html(r) for _ in range(n)])
+    for k in ('median_ms', 'min_ms', 'max_ms', 'first_ms', 'alloc_peak_kb', 'alloc_retained_kb'):
+        res[k] /= n
+    res['bytes'] = len(create_html(rec).encode('utf-8'))
+    return res
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    global REPEAT
+    ap = argparse.ArgumentParser(description="Headless benchmarks of app reruns and report rendering")
+    ap.add_argument("--repeat", type=int, default=REPEAT)
+    ap.add_argument("--out", help="write the JSON here instead of stdout")
+    ap.add_argument("--baseline", help="earlier JSON result to compare against")
+    args = ap.parse_args()
+    REPEAT = args.repeat
+
+    cases = {'cold_run': bench_cold_run()}
+    for section, (kind, key, values) in SECTION_WIDGETS.items():
+        cases[f"widget_{section}"] = bench_section(kind, key, values)
+    cases['tug_server_cycle'] = bench_tug_cycle()
+    cases['create_html_small'] = bench_create_html(record_defaults())
+    cases['create_html_large'] = bench_create_html(large_record())
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            old = json.load(f)['cases']
+        for name, res in cases.items():
+            if name in old and old[name]['median_ms']:
+                res['vs_baseline'] = res['median_ms'] / old[name]['median_ms']
+
+    result = {
+        'commit': git_commit(),
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        'python': platform.python_version(),
+        'streamlit': streamlit.__version__,
+        'platform': platform.platform(),
+        'cases': cases,
+    }
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from patient_index import PatientIndex
+from registry_schema import OPTIONS, record_defaults
+from registry_store import ConflictError, RegistryStore
+from report import create_html
+
+# ---------------------------------------------------------
+# Load test: several app processes sharing one registry database
+# ---------------------------------------------------------
+# Each worker process opens its own RegistryStore on the same file (as separate
+# `streamlit run` workers would) and runs a request mix for a fixed time:
+#   view  (load + render the HTML report)  VIEW_SHARE
+#   list  (search-index catch-up + recent-records page)  LIST_SHARE
+#   edit  (load, change, versioned save)   the rest; conflicts are retried
+# Prints one JSON document with throughput per worker count.
+#
+#   python benchmarks/loadtest.py --workers 1 2 4 8 --seconds 10
+VIEW_SHARE = 0.7
+LIST_SHARE = 0.2
+
+def name(i):
+    # Every tenth name starts with "[", like a JSON array (see registry_store._partial)
+    return f"[VIP] Patient {i}" if i % 10 == 0 else f"Patient {i}"
+
+def seed(path, patients):
+    store = RegistryStore(path)
+    rng = random.Random(0)
+    base = record_defaults()
+    store.save_many({
+        **base, 'hn': f"HN{i:06d}", 'fname': name(i),
+        'level': rng.choice(OPTIONS['level']), 'cause': rng.choice(OPTIONS['cause']),
+        'weight': round(rng.uniform(40, 90), 1),
+    } for i in range(patients))
+    # The change feed must hand every name back as the text that was saved
+    _, recs = store.changes_since(0, ['hn', 'fname'])
+    assert all(r['fname'] == name(int(r['hn'][2:])) for r in recs), "change feed altered a name"
+
+def edit(store, hn, rng):
+    # The form's save path: retry on ConflictError after reloading
+    for attempt in range(10):
+        rec, version = store.load_versioned(hn)
+        rec['weight'] = round(rng.uniform(40, 90), 1)
+        try:
+            store.save(rec, version=version)
+            return attempt
+        except ConflictError:
+            continue
+    raise RuntimeError(f"gave up saving {hn}")
+
+def worker(path, patients, hot, seconds, start, results):
+    store = RegistryStore(path)
+    index = PatientIndex.from_store(store)
+    rng = random.Random(os.getpid())
+    counts = {'view': 0, 'list': 0, 'edit': 0, 'conflicts': 0}
+    latencies = []
+    start.wait()
+    end = time.perf_counter() + seconds
+    while True:
+        t0 = time.perf_counter()
+        if t0 >= end:
+            break
+        r = rng.random()
+        # Edits go to a small set of "hot" patients so concurrent edits do collide
+        if r < VIEW_SHARE:
+            create_html(store.load(f"HN{rng.randrange(patients):06d}"))
+            counts['view'] += 1
+        elif r < VIEW_SHARE + LIST_SHARE:
+            index.refresh(store)
+            store.list_records(level=rng.choice(OPTIONS['level']), limit=20)
+            counts['list'] += 1
+        else:
+            counts['conflicts'] += edit(store, f"HN{rng.randrange(hot):06d}", rng)
+            counts['edit'] += 1
+        latencies.append(time.perf_counter() - t0)
+    results.put((counts, latencies))
+
+def run(path, workers, patients, hot, seconds):
+    ctx = multiprocessing.get_context("spawn")
+    start, results = ctx.Event(), ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(path, patients, hot, seconds, start, results)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    time.sleep(1.0)  # let every process import and open its pool
+    start.set()
+    totals, latencies = {'view': 0, 'list': 0, 'edit': 0, 'conflicts': 0}, []
+    for _ in procs:
+        counts, lat = results.get()
+        for k, v in counts.items():
+            totals[k] += v
+        latencies += lat
+    for p in procs:
+        p.join()
+    latencies.sort()
+    ops = totals['view'] + totals['list'] + totals['edit']
+    return {
+        'workers': workers, 'ops': ops, 'ops_per_second': ops / seconds, **totals,
+        'p50_ms': 1000 * latencies[len(latencies) // 2] if latencies else None,
+        'p95_ms': 1000 * latencies[int(len(latencies) * 0.95)] if latencies else None,
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description="Multi-process load test of the shared registry store")
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--seconds", type=float, default=10.0)
+    ap.add_argument("--patients", type=int, default=5000)
+    ap.add_argument("--hot", type=int, default=20, help="patients that receive the edits")
+    ap.add_argument("--db", help="database to use (default: a fresh temporary one)")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or os.path.join(tmp, "loadtest.db")
+        if not os.path.exists(path):
+            seed(path, args.patients)
+        runs = [run(path, n, args.patients, args.hot, args.seconds) for n in args.workers]
+    base = runs[0]['ops_per_second'] / runs[0]['workers']
+    for r in runs:
+        r['scaling'] = r['ops_per_second'] / base if base else None
+    json.dump({'cpus': os.cpu_count(), 'seconds': args.seconds, 'patients': args.patients,
+               'hot': args.hot, 'runs': runs}, sys.stdout, indent=2)
+    print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import numpy as np
+import pandas as pd
+
+from registry_schema import DATE_KEYS, MULTI_KEYS, OPTIONS, OTHER_KEYS, record_defaults
+from tug_trends import TUG_THRESHOLD
+
+# ---------------------------------------------------------
+# Streaming bulk import of historical records (CSV / XLSX)
+# ---------------------------------------------------------
+# Files are read CHUNK_SIZE rows at a time; each chunk is normalized and
+# validated with vectorized pandas ops, then written as one batch. Import only
+# adds new HNs: rows whose HN is already stored are rejected, never merged over
+# the existing record, and dates the file doesn't give stay empty.
+CHUNK_SIZE = 5000
+
+# Spreadsheet headers we accept besides the record keys themselves (lower-cased)
+COLUMN_ALIASES = {
+    'name': 'fname', 'full name': 'fname', 'ชื่อ': 'fname', 'ชื่อ-นามสกุล': 'fname',
+    'date of birth': 'dob', 'birth date': 'dob', 'วันเกิด': 'dob', 'วัน/เดือน/ปีเกิด': 'dob',
+    'sex': 'gender', 'เพศ': 'gender', 'ประเทศ': 'country', 'จังหวัด': 'province', 'สัญชาติ': 'nationality',
+    'น้ำหนัก': 'weight', 'ส่วนสูง': 'height', 'โรคประจำตัว': 'comorbidities',
+    'สาเหตุ': 'cause', 'amputation year': 'amp_year', 'ปีที่ตัดขา': 'amp_year',
+    'ข้างที่ตัด': 'side', 'amputation level': 'level', 'ระดับการตัดขา': 'level',
+    'k-level': 'k_level', 'socket type': 'socket', 'tug': 'tug_avg', 'tug average': 'tug_avg',
+}
+
+# English / alternate spellings -> the option used by the form (keys lower-cased)
+OTHER_ALIASES = {'other': 'Other', 'others': 'Other', 'อื่นๆ': 'Other', 'อื่น ๆ': 'Other'}
+YES_NO = {
+    'surgery': ('ใช่', 'ไม่ใช่'), 'rehab': ('เคย', 'ไม่เคย'), 'fall': ('มี', 'ไม่'),
+    'fall_inj': ('ใช่', 'ไม่'), 'supp_fam': ('ใช่', 'ไม่ใช่'), 'supp_org': ('ใช่', 'ไม่ใช่'),
+}
+VALUE_ALIASES = {
+    'gender': {'male': 'ชาย', 'm': 'ชาย', 'female': 'หญิง', 'f': 'หญิง'},
+    'country': {'thai': 'Thailand', 'ไทย': 'Thailand', 'ประเทศไทย': 'Thailand'},
+    'province': {'bangkok': 'กรุงเทพมหานคร', 'กรุงเทพ': 'กรุงเทพมหานคร', 'กทม': 'กรุงเทพมหานคร',
+                 'chiang mai': 'เชียงใหม่', 'khon kaen': 'ขอนแก่น', 'phuket': 'ภูเก็ต'},
+    'nationality': {'thai': 'ไทย'},
+    'cause': {'accident': 'อุบัติเหตุ', 'trauma': 'อุบัติเหตุ', 'diabetes': 'เบาหวาน', 'dm': 'เบาหวาน',
+              'vascular': 'หลอดเลือด', 'cancer': 'มะเร็ง', 'tumor': 'มะเร็ง', 'infection': 'ติดเชื้อ',
+              'congenital': 'พิการแต่กำเนิด'},
+    'comorbidities': {'diabetes': 'เบาหวาน', 'dm': 'เบาหวาน', 'hypertension': 'ความดัน', 'ht': 'ความดัน',
+                      'heart disease': 'หัวใจ', 'cancer': 'มะเร็ง', 'infection': 'ติดเชื้อ', 'none': 'ไม่มี'},
+    'side': {'left': 'ซ้าย', 'l': 'ซ้าย', 'right': 'ขวา', 'r': 'ขวา', 'both': 'สองข้าง', 'bilateral': 'สองข้าง'},
+    'level': {'tt': 'Transtibial', 'bk': 'Transtibial', 'below knee': 'Transtibial',
+              'tf': 'Transfemoral', 'ak': 'Transfemoral', 'above knee': 'Transfemoral',
+              'kd': 'Knee disarticulation', 'ad': 'Ankle disarticulation'},
+    'stump_len': {'short': 'สั้น', 'medium': 'ปานกลาง', 'long': 'ยาว'},
+    'assist': {'none': 'ไม่ใช้', 'no': 'ไม่ใช้', 'cane': 'ไม้เท้า', 'crutch': 'ไม้เท้า'},
+}
+for _k, (_yes, _no) in YES_NO.items():
+    VALUE_ALIASES[_k] = {'yes': _yes, 'y': _yes, 'true': _yes, '1': _yes, 'no': _no, 'n': _no, 'false': _no, '0': _no}
+
+NUMERIC_KEYS = ['age', 'weight', 'height', 't1', 't2', 't3', 'tug_avg']
+LIST_SEP = r'\s*[,;|]\s*'
+
+def _lookup(key):
+    lut = {o.lower(): o for o in OPTIONS[key]}
+    lut.update(VALUE_ALIASES.get(key, {}))
+    if 'Other' in OPTIONS[key]:
+        lut.update(OTHER_ALIASES)
+    return lut
+
+LOOKUPS = {k: _lookup(k) for k in OPTIONS}
+
+def map_columns(columns):
+    # When several headers name the same field (e.g. "fname" and "Name"), the first one wins
+    known = set(record_defaults())
+    mapping = {}
+    for c in columns:
+        name = str(c).strip()
+        key = name if name in known else COLUMN_ALIASES.get(name.lower(), name.lower())
+        if key in known and key not in mapping.values():
+            mapping[c] = key
+    return mapping
+
+def _parse_dates(s):
+    # ISO (yyyy-mm-dd, also Excel datetimes) or d/m/yyyy; Buddhist years are converted
+    iso = s.str.extract(r'^(\d{4})-(\d{1,2})-(\d{1,2})')
+    dmy = s.str.extract(r'^(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})')
+    y = pd.to_numeric(iso[0].fillna(dmy[2]))
+    parts = pd.DataFrame({
+        'year': y.where(y < 2400, y - 543),
+        'month': pd.to_numeric(iso[1].fillna(dmy[1])),
+        'day': pd.to_numeric(iso[2].fillna(dmy[0])),
+    })
+    return pd.to_datetime(parts, errors='coerce')
+
+def normalize_chunk(raw, first_row=2):
+    # Returns (records, their positions in `raw`, rejected) for one chunk of string-typed rows
+    raw = raw.reset_index(drop=True)
+    colmap = map_columns(raw.columns)
+    df = raw[list(colmap)].rename(columns=colmap).fillna('').astype(str)
+    df = df.apply(lambda c: c.str.strip())
+    n = len(df)
+    reasons = pd.Series([''] * n)
+
+    def fail(mask, msg):
+        mask = np.asarray(mask, dtype=bool) & (reasons == '').to_numpy()
+        reasons[mask] = msg
+
+    base = {**record_defaults(), **dict.fromkeys(DATE_KEYS)}
+    out = pd.DataFrame(index=df.index)
+
+    hn = df['hn'] if 'hn' in df else pd.Series([''] * n)
+    fail(hn == '', "missing hn")
+    out['hn'] = hn
+
+    for key in [k for k in OPTIONS if k not in MULTI_KEYS and k in df]:
+        s = df[key]
+        norm = s.str.lower().map(LOOKUPS[key])
+        empty = s == ''
+        unknown = norm.isna() & ~empty
+        if 'Other' in OPTIONS[key]:
+            ot = OTHER_KEYS[key]
+            given = df[ot] if ot in df else pd.Series([''] * n)
+            out[ot] = given.where(~unknown | (given != ''), s)
+            norm = norm.where(~unknown, 'Other')
+        else:
+            fail(unknown, f"invalid {key}")
+        out[key] = norm.where(~empty, base[key])
+
+    for key in [k for k in MULTI_KEYS if k in df]:
+        parts = df[key].str.split(LIST_SEP, regex=True).explode()
+        parts = parts[parts.notna() & (parts != '')]
+        norm = parts.str.lower().map(LOOKUPS[key])
+        unknown = norm.isna().to_numpy()
+        rows = parts.index.to_numpy()
+        if 'Other' in OPTIONS[key]:
+            ot = OTHER_KEYS[key]
+            extra = [[] for _ in range(n)]
+            for i, v in zip(rows[unknown], parts.to_numpy()[unknown]):
+                extra[i].append(v)
+            given = df[ot] if ot in df else pd.Series([''] * n)
+            out[ot] = given.where(given != '', pd.Series([', '.join(e) for e in extra]))
+            norm = norm.where(~unknown, 'Other')
+        else:
+            bad = np.zeros(n, dtype=bool)
+            bad[rows[unknown]] = True
+            fail(bad, f"invalid {key}")
+        # Regroup the exploded values into de-duplicated per-row lists
+        lists = [[] for _ in range(n)]
+        for i, v in zip(rows, norm.to_numpy()):
+            if isinstance(v, str) and v not in lists[i]:
+                lists[i].append(v)
+        out[key] = lists
+
+    for key in [k for k in NUMERIC_KEYS if k in df]:
+        num = pd.to_numeric(df[key], errors='coerce')
+        fail((df[key] != '') & (num.isna() | (num < 0)), f"invalid {key}")
+        out[key] = num.fillna(base[key]).astype(type(base[key]))
+
+    if 'amp_year' in df:
+        yr = pd.to_numeric(df['amp_year'], errors='coerce')
+        yr = yr.where(yr >= 2400, yr + 543)  # A.D. -> B.E.
+        fail((df['amp_year'] != '') & ~yr.between(2490, 2600), "invalid amp_year")
+        out['amp_year'] = yr.fillna(base['amp_year']).astype(int)
+
+    for key in [k for k in DATE_KEYS if k in df]:
+        dt = _parse_dates(df[key])
+        fail((df[key] != '') & dt.isna(), f"invalid {key}")
+        out[key] = dt.dt.date.astype(object).where(dt.notna(), None)
+
+    # Derive the TUG summary when only the trials were given
+    trials = out[[t for t in ('t1', 't2', 't3') if t in out]]
+    if 'tug_avg' not in df and not trials.empty:
+        out['tug_avg'] = trials.where(trials > 0).mean(axis=1).fillna(0.0)
+    if 'tug_avg' in out:
+        out['tug_status'] = np.where(out['tug_avg'] >= TUG_THRESHOLD, "⚠️ High Fall Risk",
+                                     np.where(out['tug_avg'] > 0, "✅ Normal Mobility", "-"))
+
+    # Remaining mapped columns are free text (fname, *_ot, tug_status, ...)
+    for key in df.columns.difference(out.columns):
+        out[key] = df[key]
+
+    ok = (reasons == '').to_numpy()
+    records = [{**base, **r} for r in out[ok].to_dict('records')]
+    rejected = raw[~ok].assign(row=np.arange(first_row, first_row + n)[~ok], reason=reasons[~ok].to_numpy())
+    return records, np.flatnonzero(ok), rejected
+
+def iter_chunks(f, name, chunksize=CHUNK_SIZE):
+    # Yields (DataFrame of strings, fraction of file read)
+    if name.lower().endswith(('.xlsx', '.xlsm')):
+        import openpyxl
+        wb = openpyxl.load_workbook(f, read_only=True, data_only=True)
+        ws = wb.active
+        total = max((ws.max_row or 1) - 1, 1)
+        rows = ws.iter_rows(values_only=True)
+        header = [str(h) if h is not None else '' for h in next(rows, ())]
+        batch, done = [], 0
+        for r in rows:
+            batch.append(['' if v is None else str(v) for v in r])
+            if len(batch) >= chunksize:
+                done += len(batch)
+                yield pd.DataFrame(batch, columns=header), min(done / total, 1.0)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=header), 1.0
+        wb.close()
+    else:
+        f.seek(0, 2)
+        size = f.tell() or 1
+        f.seek(0)
+        reader = pd.read_csv(f, dtype=str, keep_default_na=False, chunksize=chunksize, encoding='utf-8-sig')
+        for chunk in reader:
+            yield chunk, min(f.tell() / size, 1.0)
+
+def import_file(f, name, store, chunksize=CHUNK_SIZE, on_progress=None, on_batch=None):
+    imported, rejected, row = 0, [], 2  # row 1 is the header
+    for chunk, frac in iter_chunks(f, name, chunksize):
+        records, pos, bad = normalize_chunk(chunk, first_row=row)
+        if len(bad):
+            rejected.append(bad)
+        if records:
+            skipped = store.insert_new(records)
+            if skipped:
+                dup = pos[skipped]
+                rejected.append(chunk.reset_index(drop=True).iloc[dup].assign(row=row + dup, reason="hn already exists"))
+                skipped = set(skipped)
+                records = [r for i, r in enumerate(records) if i not in skipped]
+            imported += len(records)
+            if on_batch and records:
+                on_batch(records)
+        row += len(chunk)
+        if on_progress:
+            on_progress(frac, imported, sum(len(b) for b in rejected))
+    if rejected:
+        rejected = pd.concat(rejected, ignore_index=True).sort_values('row', kind='stable', ignore_index=True)
+    else:
+        rejected = pd.DataFrame(columns=['row', 'reason'])
+    return imported, rejected
@@ -0,0 +1,202 @@
+import threading
+from collections import Counter, OrderedDict
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+# ---------------------------------------------------------
+# Cohort analytics over the whole registry
+# ---------------------------------------------------------
+# Built once per process from the store, then kept current by upsert() on every
+# save. Unfiltered aggregates are running counters (no scan at all); filtered
+# views run pandas group-bys over a compact categorical frame. Summaries are
+# cached per filter set until the data changes, so reruns that leave the
+# filters alone cost nothing.
+SINGLE_KEYS = ['province', 'cause', 'level', 'k_level', 'fall', 'assist', 'socket', 'liner']
+MULTI_KEYS = ['foot', 'knee']
+FIELDS = ['hn', 'date_deliv', 'tug_avg'] + SINGLE_KEYS + MULTI_KEYS
+CACHE_SIZE = 16  # filter sets kept
+
+def cohort_row(rec):
+    d = rec.get('date_deliv')
+    row = {k: rec.get(k) for k in SINGLE_KEYS}
+    row['date_deliv'] = d if isinstance(d, date) else (date.fromisoformat(d) if d else None)
+    row['tug_avg'] = float(rec.get('tug_avg') or 0.0)
+    for k in MULTI_KEYS:
+        row[k] = tuple(rec.get(k) or ())
+    return row
+
+def _contrib(row):
+    # Everything a single record adds to the running counters
+    yield 'cause_level', (row['cause'], row['level'])
+    yield 'fall_assist', (row['fall'], row['assist'])
+    for k in ('socket', 'liner'):
+        yield 'components', (k, row[k])
+    for k in MULTI_KEYS:
+        for v in row[k]:
+            yield 'components', (k, v)
+
+def _to_frame(rows):
+    df = pd.DataFrame.from_records(rows, index='hn', columns=['hn'] + SINGLE_KEYS + ['date_deliv', 'tug_avg'] + MULTI_KEYS)
+    for k in SINGLE_KEYS:
+        df[k] = df[k].astype('category')
+    df['date_deliv'] = pd.to_datetime(df['date_deliv'])
+    df['tug_avg'] = df['tug_avg'].astype('float32')
+    return df
+
+COMPONENT_KEYS = ['socket', 'liner'] + MULTI_KEYS
+
+def _by_label(index):
+    return index.map(str)
+
+def _table(df, index, columns, order=None):
+    # One layout for both summary paths (running counters and filtered frame):
+    # plain sorted labels, int64 counts, no all-zero rows, fixed columns if given
+    df = df.fillna(0).astype('int64')
+    df.index = pd.Index(list(df.index), name=index, dtype=object)
+    df.columns = pd.Index(list(df.columns), name=columns, dtype=object)
+    df = df.loc[(df != 0).any(axis=1)]
+    if order:
+        df = df.reindex(columns=pd.Index(order, name=columns), fill_value=0)
+    else:
+        df = df.loc[:, (df != 0).any(axis=0)].sort_index(axis=1, key=_by_label)
+    return df.sort_index(key=_by_label)
+
+def _k_tug(df):
+    df = df.astype({'tug_avg': 'float64', 'n': 'int64'})
+    df.index = pd.Index(list(df.index), name='k_level', dtype=object)
+    return df[df['n'] > 0].sort_index(key=_by_label)
+
+class Cohort:
+    def __init__(self, records=()):
+        self.lock = threading.Lock()
+        self.rows = {}
+        self.counts = {'cause_level': Counter(), 'fall_assist': Counter(), 'components': Counter()}
+        self.k_tug = {}  # k_level -> [sum, n] over records with a TUG result
+        for rec in records:
+            self._apply(rec['hn'], cohort_row(rec))
+        self.df = _to_frame([dict(hn=hn, **row) for hn, row in self.rows.items()])
+        self.pending = {}
+        self.seq = 0
+        self.rev = 0  # bumped by every upsert; with seq, the cache key for summaries
+        self.cache = OrderedDict()
+
+    @classmethod
+    def from_store(cls, store):
+        seq = store.max_seq()  # taken first: anything saved during the scan is re-applied
+        cohort = cls(store.iter_records(FIELDS))
+        cohort.seq = seq
+        return cohort
+
+    def refresh(self, store):
+        # Catch up with saves made by other app processes (one indexed query when idle)
+        seq, records = store.changes_since(self.seq, FIELDS)
+        if records:
+            self.upsert_many(records)
+        self.seq = max(self.seq, seq)
+        return self
+
+    def _count(self, row, sign):
+        for name, key in _contrib(row):
+            c = self.counts[name]
+            c[key] += sign
+            if c[key] == 0:
+                del c[key]
+        if row['tug_avg'] > 0:
+            acc = self.k_tug.setdefault(row['k_level'], [0.0, 0])
+            acc[0] += sign * row['tug_avg']
+            acc[1] += sign
+
+    def _apply(self, hn, row):
+        old = self.rows.get(hn)
+        if old is not None:
+            self._count(old, -1)
+        self.rows[hn] = row
+        self._count(row, +1)
+
+    def upsert(self, rec):
+        self.upsert_many([rec])
+
+    def upsert_many(self, records):
+        rows = [(rec['hn'], cohort_row(rec)) for rec in records]
+        with self.lock:
+            for hn, row in rows:
+                self._apply(hn, row)
+                self.pending[hn] = row
+            self.rev += 1
+
+    def _frame(self):
+        # Fold saved-but-unmerged records into the frame only when a filtered query needs it
+        if self.pending:
+            new = _to_frame([dict(hn=hn, **row) for hn, row in self.pending.items()])
+            df = pd.concat([self.df.drop(index=new.index, errors='ignore'), new])
+            for k in SINGLE_KEYS:
+                df[k] = df[k].astype('category')
+            self.df, self.pending = df, {}
+        return self.df
+
+    def _cached(self, key, compute):
+        # Callers hold the lock; results are shared, treat them as read-only
+        key = (key, self.seq, self.rev)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        value = self.cache[key] = compute()
+        while len(self.cache) > CACHE_SIZE:
+            self.cache.popitem(last=False)
+        return value
+
+    def provinces(self):
+        with self.lock:
+            return self._cached('provinces', lambda: sorted({r['province'] for r in self.rows.values() if r['province']}))
+
+    def summary(self, provinces=None, date_from=None, date_to=None):
+        key = ('summary', tuple(sorted(provinces or ())), date_from, date_to)
+        with self.lock:
+            return self._cached(key, lambda: self._summary(provinces, date_from, date_to))
+
+    def _summary(self, provinces, date_from, date_to):
+        if not (provinces or date_from or date_to):
+            return self._from_counters()
+        df = self._frame()
+        mask = np.ones(len(df), dtype=bool)
+        if provinces:
+            mask &= df['province'].isin(provinces).to_numpy()
+        if date_from:
+            mask &= (df['date_deliv'] >= pd.Timestamp(date_from)).to_numpy()
+        if date_to:
+            mask &= (df['date_deliv'] <= pd.Timestamp(date_to)).to_numpy()
+        return self._from_frame(df[mask])
+
+    def _from_counters(self):
+        def table(c, names):
+            if not c:
+                return pd.DataFrame()
+            s = pd.Series(c)
+            s.index.names = names
+            return s.unstack(fill_value=0)
+        k_tug = pd.DataFrame(
+            [(k, s / n, n) for k, (s, n) in self.k_tug.items()],
+            columns=['k_level', 'tug_avg', 'n'],
+        ).set_index('k_level')
+        return {
+            'n': len(self.rows),
+            'cause_level': _table(table(self.counts['cause_level'], ['cause', 'level']), 'cause', 'level'),
+            'k_tug': _k_tug(k_tug),
+            'fall_assist': _table(table(self.counts['fall_assist'], ['fall', 'assist']), 'fall', 'assist'),
+            'components': _table(table(self.counts['components'], ['component', 'type']).T,
+                                 'type', 'component', COMPONENT_KEYS),
+        }
+
+    def _from_frame(self, df):
+        tug = df[df['tug_avg'] > 0].groupby('k_level', observed=True)['tug_avg'].agg(tug_avg='mean', n='size')
+        single = [df[k].value_counts().rename(k) for k in ('socket', 'liner')]
+        multi = [df[k].explode().dropna().value_counts().rename(k) for k in MULTI_KEYS]
+        return {
+            'n': len(df),
+            'cause_level': _table(pd.crosstab(df['cause'], df['level']), 'cause', 'level'),
+            'k_tug': _k_tug(tug),
+            'fall_assist': _table(pd.crosstab(df['fall'], df['assist']), 'fall', 'assist'),
+            'components': _table(pd.concat(single + multi, axis=1), 'type', 'component', COMPONENT_KEYS),
+        }
@@ -0,0 +1,61 @@
+import time
+import uuid
+
+# ---------------------------------------------------------
+# Debounced delta autosave of the form being edited
+# ---------------------------------------------------------
+# The app calls tick() every AUTOSAVE_SECONDS (and on its own reruns). A write
+# happens only once the form has stopped changing for a tick, or after
+# MAX_DELAY of continuous editing, and it carries only the fields that changed
+# since the previous write. Counters make the cost visible in the sidebar.
+AUTOSAVE_SECONDS = 2.0
+MAX_DELAY = 10.0
+
+def new_draft_id():
+    return uuid.uuid4().hex[:12]
+
+class DraftAutosave:
+    def __init__(self, draft_id, base, base_hn=None, base_version=0):
+        self.draft_id = draft_id
+        self.writes = self.bytes = self.fields = self.ticks = 0
+        self.tick_seconds = 0.0
+        self.last_write = None
+        self.rebase(base, base_hn, base_version)
+
+    def rebase(self, rec, base_hn=None, base_version=0):
+        # After a load/save/restore: `rec` is what the store already has, and
+        # base_version the record version a save must still find (0 = new HN)
+        self.base_hn = base_hn
+        self.base_version = base_version
+        self.saved = dict(rec)
+        self.seen = dict(rec)
+        self.dirty_since = None
+
+    def tick(self, store, rec, now=None):
+        t0 = time.perf_counter()
+        now = time.time() if now is None else now
+        self.ticks += 1
+        delta = {k: v for k, v in rec.items() if self.saved.get(k) != v}
+        changing = rec != self.seen
+        self.seen = dict(rec)
+        if not delta:
+            self.dirty_since = None
+        else:
+            if self.dirty_since is None:
+                self.dirty_since = now
+            # Still typing: wait for a quiet tick (but not forever)
+            if not changing or now - self.dirty_since >= MAX_DELAY:
+                self.bytes += store.save_draft(self.draft_id, rec.get('hn', ''), self.base_hn, self.base_version, delta)
+                self.writes += 1
+                self.fields += len(delta)
+                self.last_write = now
+                self.saved.update(delta)
+                self.dirty_since = None
+        self.tick_seconds += time.perf_counter() - t0
+        return bool(delta) and self.dirty_since is None
+
+    def stats(self):
+        return {
+            'writes': self.writes, 'bytes': self.bytes, 'fields': self.fields, 'ticks': self.ticks,
+            'ms_per_tick': 1000 * self.tick_seconds / self.ticks if self.ticks else 0.0,
+        }
@@ -0,0 +1,104 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+# ---------------------------------------------------------
+# In-memory HN / name lookup for the patient search box
+# ---------------------------------------------------------
+# Built once per process from the store and kept current by upsert() on every
+# save/import. HNs live in a sorted list (prefix = one bisect range); names are
+# case-folded into a single string so a substring search is a few str.find()
+# calls in C instead of a Python loop over every patient. Renames are not
+# patched into that string: changed HNs go to `pending` (scanned directly) and
+# the string is rebuilt once pending grows past REBUILD_AT.
+REBUILD_AT = 2048
+SEP = "\x00"
+
+def _fold(s):
+    return " ".join(str(s or "").split()).casefold()
+
+class PatientIndex:
+    def __init__(self, pairs=()):
+        self.lock = threading.Lock()
+        self.names = {}  # hn -> fname (current)
+        for hn, fname in pairs:
+            self.names[hn] = fname or ""
+        self.hns = sorted(self.names)
+        self.seq = 0
+        self._rebuild()
+
+    @classmethod
+    def from_store(cls, store):
+        seq = store.max_seq()  # taken first: anything saved during the scan is re-applied
+        index = cls(store.iter_names())
+        index.seq = seq
+        return index
+
+    def refresh(self, store):
+        # Catch up with saves made by other app processes (one indexed query when idle)
+        seq, records = store.changes_since(self.seq, ['hn', 'fname'])
+        if records:
+            self.upsert_many(records)
+        self.seq = max(self.seq, seq)
+        return self
+
+    def _rebuild(self):
+        self.rows = list(self.names)  # row -> hn, aligned with `starts`
+        folded = [_fold(self.names[hn]) for hn in self.rows]
+        self.starts, pos = [], 0
+        for f in folded:
+            self.starts.append(pos)
+            pos += len(f) + 1
+        self.blob = SEP.join(folded) + SEP
+        self.pending = {}  # hn -> folded name, changed since the last rebuild
+
+    def upsert(self, hn, fname):
+        self.upsert_many([{'hn': hn, 'fname': fname}])
+
+    def upsert_many(self, records):
+        with self.lock:
+            for rec in records:
+                hn, fname = rec['hn'], rec.get('fname') or ""
+                old = self.names.get(hn)
+                if old is None:
+                    insort(self.hns, hn)
+                elif old == fname:
+                    continue
+                self.names[hn] = fname
+                self.pending[hn] = _fold(fname)
+            if len(self.pending) > REBUILD_AT:
+                self._rebuild()
+
+    def __len__(self):
+        return len(self.names)
+
+    def search(self, query, limit=8):
+        # HN prefix matches first (sorted), then name substring matches
+        q = query.strip()
+        if not q:
+            return []
+        with self.lock:
+            lo = bisect_left(self.hns, q)
+            hi = min(bisect_right(self.hns, q + "\U0010ffff"), lo + limit)
+            out = [(hn, self.names[hn]) for hn in self.hns[lo:hi]]
+            seen = {hn for hn, _ in out}
+            fq = _fold(q)
+            if SEP in fq or len(out) >= limit:
+                return out
+
+            def take(hn):
+                if hn not in seen and fq in self.pending.get(hn, fq):
+                    seen.add(hn)
+                    out.append((hn, self.names[hn]))
+                return len(out) >= limit
+
+            for hn, folded in self.pending.items():
+                if fq in folded and take(hn):
+                    return out
+            pos = self.blob.find(fq)
+            while pos >= 0:
+                row = bisect_right(self.starts, pos) - 1
+                if take(self.rows[row]):
+                    break
+                # Skip to the next name; one match per row is enough
+                pos = self.blob.find(fq, self.starts[row + 1] if row + 1 < len(self.starts) else len(self.blob))
+            return out
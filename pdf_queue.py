@@ -0,0 +1,85 @@
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from report_pdf import create_pdf
+
+# ---------------------------------------------------------
+# Background PDF rendering
+# ---------------------------------------------------------
+# One queue per server process, shared by all sessions. Rendering happens in a
+# separate worker process, so a slow PDF never holds the GIL of the Streamlit
+# server. Finished PDFs are cached by record version (content digest), in
+# memory and, given a store, in its pdf_cache table so every app process can
+# serve them; a version that is already queued or cached is not rendered
+# again. If the worker dies (out of memory, a crash in native code) the pool
+# is replaced on the next submit.
+PDF_WORKERS = 1
+PDF_CACHE_SIZE = 64  # PDFs kept, in memory and in the store
+
+class PdfQueue:
+    def __init__(self, store=None, workers=PDF_WORKERS, cache_size=PDF_CACHE_SIZE):
+        self.store = store
+        self.workers = workers
+        self.pool = self._new_pool()
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+        self.done = OrderedDict()  # version -> PDF bytes
+        self.jobs = {}             # version -> Future
+        self.errors = {}           # version -> message
+
+    def submit(self, rec, version):
+        if self.status(version)[0] == 'done':
+            return
+        with self.lock:
+            if version in self.done or version in self.jobs:
+                return
+            self.errors.pop(version, None)
+            try:
+                fut = self.pool.submit(create_pdf, dict(rec))
+            except BrokenProcessPool:
+                self.pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = self._new_pool()
+                fut = self.pool.submit(create_pdf, dict(rec))
+            self.jobs[version] = fut
+        fut.add_done_callback(lambda f: self._finish(version, f))
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _finish(self, version, fut):
+        with self.lock:
+            self.jobs.pop(version, None)
+            exc = fut.exception()
+            if exc is not None:
+                self.errors[version] = str(exc)
+                return
+            data = fut.result()
+            self._remember(version, data)
+        if self.store is not None:
+            self.store.save_pdf(version, data, self.cache_size)
+
+    def _remember(self, version, data):
+        self.done[version] = data
+        while len(self.done) > self.cache_size:
+            self.done.popitem(last=False)
+
+    def status(self, version):
+        # ('done', bytes) | ('pending', None) | ('error', message) | (None, None)
+        with self.lock:
+            if version in self.done:
+                self.done.move_to_end(version)
+                return 'done', self.done[version]
+            if version in self.jobs:
+                return 'pending', None
+            if version in self.errors:
+                return 'error', self.errors[version]
+        # Perhaps rendered by another app process
+        data = self.store.load_pdf(version) if self.store is not None else None
+        if data is None:
+            return None, None
+        with self.lock:
+            self._remember(version, data)
+        return 'done', data
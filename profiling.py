@@ -0,0 +1,220 @@
+import atexit
+import functools
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import nullcontext
+from datetime import date
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# ---------------------------------------------------------
+# Opt-in per-rerun profiling (REGISTRY_PROFILE=1)
+# ---------------------------------------------------------
+# Spans time named parts of the script; every full run and every fragment rerun
+# is counted with its trigger (the widget whose value changed, or the button
+# that was pressed). Totals are per process and are rewritten every
+# FLUSH_SECONDS to that process's own METRICS_PATH ("{pid}" in the path is the
+# process id) in Prometheus text format, e.g. for node_exporter's textfile
+# collector. Every series carries a process="<host>:<pid>" label so several
+# app processes don't collide; a process removes its file when it exits.
+# Per-session counts stay in session state (the admin panel) and are not
+# exported. When off, span() hands back one shared no-op context and timed()
+# returns the function itself.
+ENABLED = os.environ.get("REGISTRY_PROFILE") == "1"
+PROCESS = f"{socket.gethostname()}:{os.getpid()}"
+METRICS_PATH = os.environ.get(
+    "REGISTRY_METRICS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "metrics-{pid}.prom"),
+).replace("{pid}", str(os.getpid()))
+FLUSH_SECONDS = 10.0
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_NOOP = nullcontext()
+SEEN_KEY = "_prof_seen"
+_local = threading.local()  # fragment nesting depth on this script thread
+TRACKED_TYPES = (str, int, float, bool, date, list, tuple, type(None))  # widget-like values
+# Widget keys built from data (search results are keyed pick_<HN>) are reported
+# by their prefix alone: no HNs in the metrics, and a bounded set of series
+DYNAMIC_PREFIXES = ("pick_",)
+
+class Profiler:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spans = {}                   # name -> [count, sum, max, bucket counts]
+        self.reruns = Counter()           # (scope, trigger) -> count
+        self.last_flush = time.time()
+
+    def observe(self, name, seconds):
+        with self.lock:
+            s = self.spans.get(name)
+            if s is None:
+                s = self.spans[name] = [0, 0.0, 0.0, [0] * len(BUCKETS)]
+            s[0] += 1
+            s[1] += seconds
+            s[2] = max(s[2], seconds)
+            i = bisect_left(BUCKETS, seconds)
+            if i < len(BUCKETS):
+                s[3][i] += 1
+
+    def rerun(self, scope, trigger):
+        with self.lock:
+            self.reruns[scope, trigger] += 1
+            due = time.time() - self.last_flush >= FLUSH_SECONDS
+        if due:
+            self.flush()
+
+    def span_table(self):
+        with self.lock:
+            return [{'span': name, 'count': c, 'mean_ms': 1000 * total / c, 'max_ms': 1000 * mx, 'total_s': total}
+                    for name, (c, total, mx, _) in sorted(self.spans.items(), key=lambda kv: -kv[1][1])]
+
+    def rerun_table(self):
+        with self.lock:
+            return [{'scope': scope, 'trigger': trigger, 'reruns': n} for (scope, trigger), n in self.reruns.most_common()]
+
+    def prometheus(self):
+        proc = f'process="{_escape(PROCESS)}"'
+        with self.lock:
+            lines = ["# HELP registry_span_seconds Time spent in instrumented parts of the app script",
+                     "# TYPE registry_span_seconds histogram"]
+            for name, (count, total, _, buckets) in sorted(self.spans.items()):
+                label = f'{proc},span="{_escape(name)}"'
+                acc = 0
+                for le, n in zip(BUCKETS, buckets):
+                    acc += n
+                    lines.append(f'registry_span_seconds_bucket{{{label},le="{le}"}} {acc}')
+                lines.append(f'registry_span_seconds_bucket{{{label},le="+Inf"}} {count}')
+                lines.append(f"registry_span_seconds_sum{{{label}}} {total:.6f}")
+                lines.append(f"registry_span_seconds_count{{{label}}} {count}")
+            lines += ["# HELP registry_reruns_total Script runs by scope (app or fragment) and trigger",
+                      "# TYPE registry_reruns_total counter"]
+            for (scope, trigger), n in sorted(self.reruns.items()):
+                lines.append(f'registry_reruns_total{{{proc},scope="{_escape(scope)}",trigger="{_escape(trigger)}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+    def flush(self, path=METRICS_PATH):
+        # Replaced atomically, so a scraper never reads half a file
+        text = self.prometheus()
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+        with self.lock:
+            self.last_flush = time.time()
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _remove_metrics(path=METRICS_PATH):
+    # Don't leave a dead process's counters behind for the collector
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+# One per process; plain module state so non-script threads (deferred downloads) can record too
+PROFILER = Profiler()
+if ENABLED:
+    atexit.register(_remove_metrics)
+
+def span(name):
+    if not ENABLED:
+        return _NOOP
+    return _Span(name)
+
+class _Span:
+    __slots__ = ('name', 't0')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        PROFILER.observe(self.name, time.perf_counter() - self.t0)
+
+# ---------------------------------------------------------
+# Rerun triggers
+# ---------------------------------------------------------
+def _trigger():
+    # Compare session state with the end of the previous run: a pressed button
+    # is True for exactly one run, anything else that changed is a widget edit
+    state = st.session_state
+    seen = state.get(SEEN_KEY)
+    if seen is None:
+        return "initial"
+    changed = None
+    for k, old in seen.items():
+        if k not in state:
+            continue  # widget no longer rendered
+        v = state[k]
+        if v is True and old is False:
+            return _key_label(k)
+        if changed is None and v is not old and v != old:
+            changed = k
+    return _key_label(changed) if changed else "timer/rerun"
+
+def _key_label(key):
+    for prefix in DYNAMIC_PREFIXES:
+        if key.startswith(prefix):
+            return prefix.rstrip("_")
+    return key
+
+def _remember():
+    state = st.session_state
+    st.session_state[SEEN_KEY] = {k: v for k in state if not k.startswith("_prof")
+                                  and isinstance(v := state[k], TRACKED_TYPES)}
+
+def _count(scope):
+    trigger = _trigger()
+    runs = st.session_state.get("_prof_runs", Counter())
+    runs[scope, trigger] += 1
+    st.session_state._prof_runs = runs
+    PROFILER.rerun(scope, trigger)
+
+def begin_run():
+    # Call at the top of the script (full-app runs)
+    if ENABLED:
+        st.session_state._prof_t0 = time.perf_counter()
+        _count("app")
+
+def end_run():
+    # Call at the very end of the script
+    if ENABLED and "_prof_t0" in st.session_state:
+        PROFILER.observe("run", time.perf_counter() - st.session_state.pop("_prof_t0"))
+        _remember()
+
+def _fragment_rerun():
+    # True only for the outermost fragment of a fragment-scoped rerun
+    ctx = get_script_run_ctx()
+    return bool(ctx and ctx.fragment_ids_this_run) and not getattr(_local, 'depth', 0)
+
+def timed(name):
+    # Decorator for fragment bodies: a span, plus rerun counting when the
+    # fragment reruns on its own (not as part of a full run).
+    # Use as the inner decorator: @st.fragment / @timed("...") / def ...
+    def wrap(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            own = _fragment_rerun()
+            if own:
+                _count(name)
+            _local.depth = getattr(_local, 'depth', 0) + 1
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _local.depth -= 1
+                PROFILER.observe(name, time.perf_counter() - t0)
+                if own:
+                    _remember()
+        return inner
+    return wrap
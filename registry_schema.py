@@ -0,0 +1,114 @@
+from datetime import date
+
+# ---------------------------------------------------------
+# Registry record schema (shared by the app, store, import and exports)
+# ---------------------------------------------------------
+def record_defaults():
+    # Default values matching PDF structure
+    return {
+        # 1. General Info (PDF Items 1-8)
+        'hn': '', 'fname': '', 
+        'dob': date(1980, 1, 1), 'age': 0,
+        'gender': 'ชาย', 
+        'country': 'Thailand', 'country_ot': '',
+        'province': 'กรุงเทพมหานคร', 'province_ot': '',
+        'nationality': 'ไทย', 'nationality_ot': '',
+        'weight': 0.0, 'height': 0.0,
+
+        # 2. Medical (PDF Items 9-17)
+        'comorbidities': [], 'comorb_ot': '',
+        'cause': 'อุบัติเหตุ', 'cause_ot': '',
+        'amp_year': 2560, 'side': 'ขวา',
+        'level': 'Transtibial', 'level_ot': '',
+        'stump_len': 'ปานกลาง', 
+        'stump_shape': 'Cylindrical', 'shape_ot': '',
+        'surgery': 'ไม่ใช่', 'surg_details': [],
+        'k_level': 'K1',
+
+        # 3. Rehab (PDF Items 18-19)
+        'personnel': [], 'personnel_ot': '',
+        'rehab': 'ไม่เคย', 'rehab_act': [], 'rehab_act_ot': '',
+
+        # 4. Prosthesis (PDF Items 20-27)
+        'service': [], 'service_ot': '',
+        'date_cast': date.today(), 'date_deliv': date.today(),
+        'socket': 'PTB', 'socket_ot': '',
+        'liner': 'None', 'liner_ot': '',
+        'suspension': [], 'susp_ot': '',
+        'foot': [], 'foot_ot': '',
+        'knee': [], 'knee_ot': '', # Only for Transfemoral+
+
+        # 5. Social (PDF Items 28-33)
+        'assist': 'ไม่ใช้', 'assist_ot': '',
+        'stand_hr': '1-3 ชม.', 'walk_hr': '1-3 ชม.',
+        'fall': 'ไม่', 'fall_freq': '< 1 ครั้ง', 'fall_inj': 'ไม่',
+        'q31_1': 'ไม่มีปัญหา (0-4%)', 'q31_2': 'ไม่มีปัญหา (0-4%)',
+        'q32_1': 'ไม่มีปัญหา (0-4%)', 'q32_2': 'ไม่มีปัญหา (0-4%)',
+        'supp_fam': 'ใช่', 'supp_org': 'ไม่ใช่', 
+        'supp_src': [], 'supp_src_ot': '',
+
+        # TUG
+        't1': 0.0, 't2': 0.0, 't3': 0.0, 'tug_avg': 0.0, 'tug_status': '-'
+    }
+
+PROBLEM_SCALE = ["ไม่มีปัญหา (0-4%)", "เล็กน้อย (5-24%)", "ปานกลาง (25-49%)", "มาก (50-95%)", "มากที่สุด (96-100%)"]
+
+# Choices offered by each selectbox / radio / multiselect in the form
+OPTIONS = {
+    # 1. General Info
+    'gender': ["ชาย", "หญิง"],
+    'country': ["Thailand", "Other"],
+    'province': ["กรุงเทพมหานคร", "เชียงใหม่", "ขอนแก่น", "ภูเก็ต", "Other"],
+    'nationality': ["ไทย", "Other"],
+
+    # 2. Medical
+    'comorbidities': ["เบาหวาน", "ความดัน", "หัวใจ", "มะเร็ง", "ติดเชื้อ", "ไม่มี", "Other"],
+    'cause': ["อุบัติเหตุ", "เบาหวาน", "หลอดเลือด", "มะเร็ง", "ติดเชื้อ", "พิการแต่กำเนิด", "Other"],
+    'side': ["ซ้าย", "ขวา", "สองข้าง"],
+    'level': ["Ankle disarticulation", "Transtibial", "Knee disarticulation", "Transfemoral", "Other"],
+    'stump_len': ["สั้น", "ปานกลาง", "ยาว"],
+    'stump_shape': ["Conical", "Cylindrical", "Bulbous", "Other"],
+    'surgery': ["ไม่ใช่", "ใช่"],
+    'surg_details': ["ตัดกระดูก", "ตัดผิวหนัง", "ตัดระดับสูงขึ้น"],
+    'k_level': ["K0", "K1", "K2", "K3", "K4"],
+
+    # 3. Rehab
+    'personnel': ["นักกายอุปกรณ์", "นักกายภาพ", "แพทย์", "พยาบาล", "Other"],
+    'rehab': ["ไม่เคย", "เคย"],
+    'rehab_act': ["ถุงลดบวม", "ผ้ายืด", "เบ้าซิลิโคน", "ฝึกเดิน", "Other"],
+
+    # 4. Prosthesis
+    'service': ["ทำใหม่", "เปลี่ยนเบ้า", "ซ่อม", "Other"],
+    'socket': ["PTB", "TSB", "KBM", "Quadrilateral", "Ischial Containment", "Other"],
+    'liner': ["None", "Foam", "Silicone", "Gel", "Other"],
+    'suspension': ["Cuff", "Pin Lock", "Suction", "Vacuum", "Belt", "Other"],
+    'foot': ["SACH", "Single Axis", "Dynamic", "Microprocessor", "Other"],
+    'knee': ["Single Axis", "Polycentric", "Hydraulic", "Microprocessor", "Other"],
+
+    # 5. Social
+    'assist': ["ไม่ใช้", "ไม้เท้า", "Walker", "Wheelchair", "Other"],
+    'stand_hr': ["ไม่ยืน", "< 1 ชม.", "1-3 ชม.", "3-7 ชม.", "> 8 ชม."],
+    'walk_hr': ["ไม่เดิน", "< 1 ชม.", "1-3 ชม.", "3-7 ชม.", "> 8 ชม."],
+    'fall': ["ไม่", "มี"],
+    'fall_freq': ["< 1 ครั้ง", "1-2 ครั้ง", "3-4 ครั้ง", "> 4 ครั้ง"],
+    'fall_inj': ["ไม่", "ใช่"],
+    'q31_1': PROBLEM_SCALE,
+    'q31_2': PROBLEM_SCALE,
+    'q32_1': PROBLEM_SCALE,
+    'q32_2': PROBLEM_SCALE,
+    'supp_fam': ["ใช่", "ไม่ใช่"],
+    'supp_org': ["ไม่ใช่", "ใช่"],
+    'supp_src': ["รัฐ", "ไม่แสวงหากำไร", "จ่ายเอง", "Other"],
+}
+
+MULTI_KEYS = ['comorbidities', 'surg_details', 'personnel', 'rehab_act', 'service', 'suspension', 'foot', 'knee', 'supp_src']
+DATE_KEYS = ['dob', 'date_cast', 'date_deliv']
+
+# Free-text box that goes with each field's "Other" choice
+OTHER_KEYS = {
+    'country': 'country_ot', 'province': 'province_ot', 'nationality': 'nationality_ot',
+    'comorbidities': 'comorb_ot', 'cause': 'cause_ot', 'level': 'level_ot', 'stump_shape': 'shape_ot',
+    'personnel': 'personnel_ot', 'rehab_act': 'rehab_act_ot', 'service': 'service_ot',
+    'socket': 'socket_ot', 'liner': 'liner_ot', 'suspension': 'susp_ot', 'foot': 'foot_ot', 'knee': 'knee_ot',
+    'assist': 'assist_ot', 'supp_src': 'supp_src_ot',
+}
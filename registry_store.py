@@ -0,0 +1,377 @@
+import json
+import os
+import queue
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import date
+
+from registry_schema import DATE_KEYS
+
+# ---------------------------------------------------------
+# SQLite persistence for registry records
+# ---------------------------------------------------------
+# One row per patient (HN). The full record is kept as JSON; the fields we
+# filter/sort on are copied into indexed columns (level/cause indexes also
+# carry date_deliv so filtered lists come back already sorted).
+#
+# The database file is the only state shared between app processes, so several
+# `streamlit run` workers can serve one registry when REGISTRY_DB points them
+# at the same file. Every write bumps the record's `version` (optimistic
+# concurrency for the form) and takes the next `seq` (a change feed that lets
+# each process catch its in-memory caches up with the others' saves).
+DB_PATH = os.environ.get("REGISTRY_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "registry.db"))
+POOL_SIZE = int(os.environ.get("REGISTRY_POOL_SIZE", "4"))
+BUSY_TIMEOUT = 30  # seconds to wait for another process's write
+
+BATCH_SIZE = 500
+DRAFT_TTL_DAYS = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    hn          TEXT PRIMARY KEY,
+    fname       TEXT,
+    level       TEXT,
+    cause       TEXT,
+    date_deliv  TEXT,
+    updated_at  REAL,
+    data        TEXT NOT NULL,
+    version     INTEGER NOT NULL DEFAULT 1,
+    seq         INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_records_level ON records(level, date_deliv);
+CREATE INDEX IF NOT EXISTS idx_records_cause ON records(cause, date_deliv);
+CREATE INDEX IF NOT EXISTS idx_records_date_deliv ON records(date_deliv);
+
+-- Append-only TUG series: one packed float64 blob per HN (see tug_trends.py)
+CREATE TABLE IF NOT EXISTS tug_history (
+    hn          TEXT PRIMARY KEY,
+    sessions    INTEGER NOT NULL,
+    data        BLOB NOT NULL
+);
+
+-- Autosaved, not-yet-saved form edits; `data` holds only the fields that differ
+-- from the base record (the record loaded from `base_hn`, or the form defaults)
+CREATE TABLE IF NOT EXISTS drafts (
+    draft_id    TEXT PRIMARY KEY,
+    hn          TEXT,
+    base_hn     TEXT,
+    base_version INTEGER NOT NULL DEFAULT 0,
+    updated_at  REAL,
+    data        TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_drafts_hn ON drafts(hn, updated_at);
+
+-- Rendered PDFs by report digest (see pdf_queue.py), so a report rendered by
+-- one app process is served by the others too
+CREATE TABLE IF NOT EXISTS pdf_cache (
+    version     TEXT PRIMARY KEY,
+    created_at  REAL,
+    data        BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_pdf_cache_created ON pdf_cache(created_at);
+"""
+
+# Columns added after a table first shipped: (table, column, declaration)
+MIGRATIONS = [
+    ('records', 'version', "INTEGER NOT NULL DEFAULT 1"),
+    ('records', 'seq', "INTEGER NOT NULL DEFAULT 0"),
+    ('drafts', 'base_version', "INTEGER NOT NULL DEFAULT 0"),
+]
+
+UPSERT = (
+    "INSERT INTO records (hn, fname, level, cause, date_deliv, updated_at, data, seq) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(hn) DO UPDATE SET fname=excluded.fname, level=excluded.level, "
+    "cause=excluded.cause, date_deliv=excluded.date_deliv, updated_at=excluded.updated_at, "
+    "data=excluded.data, seq=excluded.seq, version=records.version + 1 "
+    "RETURNING version"
+)
+
+class ConflictError(Exception):
+    # save() with a version that is no longer current: someone else saved this HN
+    def __init__(self, hn, expected, actual):
+        super().__init__(f"HN {hn} is at version {actual}, not {expected}")
+        self.hn, self.expected, self.actual = hn, expected, actual
+
+def encode_record(rec):
+    return json.dumps({k: v.isoformat() if isinstance(v, date) else v for k, v in rec.items()}, ensure_ascii=False)
+
+def decode_record(data):
+    rec = json.loads(data)
+    for k in DATE_KEYS:
+        if isinstance(rec.get(k), str):
+            rec[k] = date.fromisoformat(rec[k])
+    return rec
+
+def _filters(level=None, cause=None, date_from=None, date_to=None):
+    where, args = [], []
+    if level:
+        where.append("level = ?"); args.append(level)
+    if cause:
+        where.append("cause = ?"); args.append(cause)
+    if date_from:
+        where.append("date_deliv >= ?"); args.append(date_from.isoformat())
+    if date_to:
+        where.append("date_deliv <= ?"); args.append(date_to.isoformat())
+    return where, args
+
+def _extract(fields):
+    # Each field with its JSON type: json_extract returns lists (multiselects) as
+    # JSON text, indistinguishable from a string value such as "[VIP] Somchai"
+    return ", ".join(f"json_extract(data, '$.{k}'), json_type(data, '$.{k}')" for k in fields)
+
+def _partial(fields, values):
+    return {k: json.loads(v) if t in ('array', 'object') else v
+            for k, v, t in zip(fields, values[::2], values[1::2])}
+
+def _row(rec, now):
+    deliv = rec.get('date_deliv')
+    return (
+        rec['hn'], rec.get('fname', ''), rec.get('level'), rec.get('cause'),
+        deliv.isoformat() if isinstance(deliv, date) else deliv,
+        now, encode_record(rec),
+    )
+
+class RegistryStore:
+    def __init__(self, path=DB_PATH, pool_size=POOL_SIZE):
+        self.path = path
+        # Shared by all Streamlit sessions (threads) of this process; WAL lets the
+        # pooled connections read concurrently while one of them writes
+        self.pool = queue.Queue()
+        for _ in range(pool_size):
+            conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.pool.put(conn)
+        with self.connect() as conn:
+            conn.executescript(SCHEMA)
+            for table, col, decl in MIGRATIONS:
+                if col not in {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {col} {decl}")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_records_seq ON records(seq)")
+            conn.execute("DELETE FROM drafts WHERE updated_at < ?", (time.time() - DRAFT_TTL_DAYS * 86400,))
+
+    @contextmanager
+    def connect(self):
+        # Borrow a pooled connection (blocks while all are in use)
+        conn = self.pool.get()
+        try:
+            yield conn
+        finally:
+            self.pool.put(conn)
+
+    def save_many(self, records, batch_size=BATCH_SIZE):
+        # Upsert in batches, one transaction per batch (last writer wins)
+        now = time.time()
+        batch, n = [], 0
+        for rec in records:
+            batch.append(_row(rec, now))
+            if len(batch) >= batch_size:
+                n += len(self._write(batch))
+                batch = []
+        if batch:
+            n += len(self._write(batch))
+        return n
+
+    def insert_new(self, records, batch_size=BATCH_SIZE):
+        # Like save_many, but an HN that is already stored (or came earlier in
+        # `records`) is left alone. Returns the positions in `records` skipped.
+        now = time.time()
+        rows = [_row(rec, now) for rec in records]
+        skipped = []
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            written = self._write(batch, skip_existing=True)
+            skipped += [start + i for i in range(len(batch)) if i not in written]
+        return skipped
+
+    def _write(self, rows, expected=None, skip_existing=False):
+        # `expected` ({hn: version}) must still hold when the write lock is taken.
+        # Returns {position in `rows`: new version} for the rows written, read in
+        # the same transaction (another process may save right after COMMIT).
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for hn, version in (expected or {}).items():
+                    row = conn.execute("SELECT version FROM records WHERE hn = ?", (hn,)).fetchone()
+                    actual = row[0] if row else 0
+                    if actual != version:
+                        raise ConflictError(hn, version, actual)
+                keep = list(range(len(rows)))
+                if skip_existing:
+                    hns = list({r[0] for r in rows})
+                    seen = {hn for (hn,) in conn.execute(
+                        f"SELECT hn FROM records WHERE hn IN ({','.join('?' * len(hns))})", hns)}
+                    keep = []
+                    for i, r in enumerate(rows):
+                        if r[0] not in seen:
+                            seen.add(r[0])
+                            keep.append(i)
+                seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM records").fetchone()[0]
+                written = {i: conn.execute(UPSERT, rows[i] + (seq + n,)).fetchone()[0] for n, i in enumerate(keep, 1)}
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return written
+
+    def save(self, rec, version=None):
+        # With `version` (from load_versioned, 0 for a new HN) the save fails with
+        # ConflictError if the record was saved by anyone else in the meantime.
+        # Returns the record's new version.
+        return self._write([_row(rec, time.time())], None if version is None else {rec['hn']: version})[0]
+
+    def version(self, hn):
+        with self.connect() as conn:
+            row = conn.execute("SELECT version FROM records WHERE hn = ?", (hn,)).fetchone()
+        return row[0] if row else 0
+
+    def load(self, hn):
+        return self.load_versioned(hn)[0]
+
+    def load_versioned(self, hn):
+        with self.connect() as conn:
+            row = conn.execute("SELECT data, version FROM records WHERE hn = ?", (hn,)).fetchone()
+        return (decode_record(row[0]), row[1]) if row else (None, 0)
+
+    def max_seq(self):
+        with self.connect() as conn:
+            return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM records").fetchone()[0]
+
+    def changes_since(self, seq, fields):
+        # Records saved (by any process) after `seq`, as (new seq, [partial records])
+        with self.connect() as conn:
+            last = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM records").fetchone()[0]
+            if last <= seq:
+                return seq, []
+            rows = conn.execute(f"SELECT {_extract(fields)} FROM records WHERE seq > ? AND seq <= ?", (seq, last)).fetchall()
+        return last, [_partial(fields, row) for row in rows]
+
+    def list_records(self, level=None, cause=None, date_from=None, date_to=None, limit=50, offset=0):
+        # Summary rows (no JSON decoding), newest delivery first
+        where, args = _filters(level, cause, date_from, date_to)
+        sql = "SELECT hn, fname, level, cause, date_deliv, updated_at FROM records"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY date_deliv DESC LIMIT ? OFFSET ?"
+        with self.connect() as conn:
+            cur = conn.execute(sql, args + [limit, offset])
+            cols = [c[0] for c in cur.description]
+            return [dict(zip(cols, r)) for r in cur.fetchall()]
+
+    def append_tug(self, hn, row):
+        # `row` is already packed bytes; blobs are appended, never rewritten row by row
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT INTO tug_history (hn, sessions, data) VALUES (?, 1, ?) "
+                "ON CONFLICT(hn) DO UPDATE SET sessions = sessions + 1, "
+                "data = CAST(data || excluded.data AS BLOB)",
+                (hn, row),
+            )
+
+    def load_tug(self, hn):
+        with self.connect() as conn:
+            row = conn.execute("SELECT data FROM tug_history WHERE hn = ?", (hn,)).fetchone()
+        return row[0] if row else b''
+
+    def save_draft(self, draft_id, hn, base_hn, base_version, delta):
+        # Merges `delta` into the stored draft, so each autosave carries only the
+        # changed fields. Merged here rather than with SQLite json_patch, where a
+        # null would delete the key: a field cleared to None must stay cleared.
+        # Returns the size of the delta.
+        data = encode_record(delta)
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT data FROM drafts WHERE draft_id = ?", (draft_id,)).fetchone()
+                merged = encode_record({**json.loads(row[0]), **json.loads(data)}) if row else data
+                conn.execute(
+                    "INSERT INTO drafts (draft_id, hn, base_hn, base_version, updated_at, data) VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(draft_id) DO UPDATE SET hn=excluded.hn, base_hn=excluded.base_hn, "
+                    "base_version=excluded.base_version, updated_at=excluded.updated_at, data=excluded.data",
+                    (draft_id, hn, base_hn, base_version, time.time(), merged),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return len(data.encode('utf-8'))
+
+    def save_pdf(self, version, data, keep):
+        # Only the `keep` most recent PDFs are kept
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("INSERT OR REPLACE INTO pdf_cache (version, created_at, data) VALUES (?, ?, ?)",
+                             (version, time.time(), data))
+                conn.execute("DELETE FROM pdf_cache WHERE version NOT IN "
+                             "(SELECT version FROM pdf_cache ORDER BY created_at DESC LIMIT ?)", (keep,))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def load_pdf(self, version):
+        with self.connect() as conn:
+            row = conn.execute("SELECT data FROM pdf_cache WHERE version = ?", (version,)).fetchone()
+        return row[0] if row else None
+
+    def _draft(self, where, args):
+        with self.connect() as conn:
+            row = conn.execute(
+                "SELECT draft_id, hn, base_hn, base_version, updated_at, data FROM drafts WHERE " + where +
+                " ORDER BY updated_at DESC LIMIT 1", args,
+            ).fetchone()
+        if row is None:
+            return None
+        return {'draft_id': row[0], 'hn': row[1], 'base_hn': row[2], 'base_version': row[3],
+                'updated_at': row[4], 'delta': decode_record(row[5])}
+
+    def load_draft(self, draft_id):
+        return self._draft("draft_id = ?", (draft_id,))
+
+    def latest_draft(self, hn, version):
+        # Unsaved edits someone made on top of the record as it is now; drafts
+        # based on an older version (saved over since) are not offered
+        return self._draft("hn = ? AND hn != '' AND base_hn = ? AND base_version = ?", (hn, hn, version))
+
+    def delete_draft(self, draft_id):
+        # Only this tab's draft: other tabs editing the same HN keep theirs
+        with self.connect() as conn:
+            conn.execute("DELETE FROM drafts WHERE draft_id = ?", (draft_id,))
+
+    def iter_records(self, fields=None, batch_size=BATCH_SIZE, **filters):
+        # Stream records in batches; with `fields`, SQLite extracts just those keys
+        # so a full scan doesn't decode every JSON document in Python.
+        # A connection is only borrowed while fetching, never across a yield.
+        cols = _extract(fields) if fields else "data"
+        where, args = _filters(**filters)
+        sql = f"SELECT hn, {cols} FROM records WHERE " + " AND ".join(["hn > ?"] + where) + " ORDER BY hn LIMIT ?"
+        last = ''
+        while True:
+            with self.connect() as conn:
+                rows = conn.execute(sql, [last] + args + [batch_size]).fetchall()
+            if not rows:
+                break
+            last = rows[-1][0]
+            for row in rows:
+                yield _partial(fields, row[1:]) if fields else decode_record(row[1])
+
+    def iter_names(self, batch_size=5000):
+        # (hn, fname) from the plain columns, no JSON involved
+        sql = "SELECT hn, fname FROM records WHERE hn > ? ORDER BY hn LIMIT ?"
+        last = ''
+        while True:
+            with self.connect() as conn:
+                rows = conn.execute(sql, (last, batch_size)).fetchall()
+            if not rows:
+                break
+            last = rows[-1][0]
+            yield from rows
+
+    def count(self, **filters):
+        where, args = _filters(**filters)
+        sql = "SELECT COUNT(*) FROM records" + (" WHERE " + " AND ".join(where) if where else "")
+        with self.connect() as conn:
+            return conn.execute(sql, args).fetchone()[0]
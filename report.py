@@ -0,0 +1,180 @@
+import base64
+import hashlib
+import io
+import os
+import re
+from datetime import datetime, date
+from functools import lru_cache
+
+from fontTools.subset import Options, Subsetter
+from fontTools.ttLib import TTFont
+from jinja2 import Environment, FileSystemLoader
+
+# ---------------------------------------------------------
+# HTML report rendering (plain record in, HTML out; no Streamlit)
+# ---------------------------------------------------------
+# Kept free of st.* so worker processes can import it for batch exports.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_DIR = os.path.join(BASE_DIR, "templates")
+FONT_DIR = os.path.join(BASE_DIR, "static", "fonts")
+
+# Helper to get "Other" text
+def get_txt(val, ot_val):
+    if val == "Other" or val == "อื่นๆ" or (isinstance(val, list) and ("Other" in val or "อื่นๆ" in val)):
+        return f"{val} ({ot_val})"
+    return str(val)
+
+# Report content as (section title, [(label, value), ...]); shared by the HTML
+# template and the PDF renderer so both print exactly the same items
+def report_sections(rec):
+    # Imported records may have no dates
+    if isinstance(rec['dob'], date):
+        # Calculate Age logic (if needed for display update)
+        dob = f"{rec['dob'].strftime('%d/%m/%Y')} (อายุ {date.today().year - rec['dob'].year} ปี)"
+    else:
+        dob = "-"
+    t = lambda k, ot: get_txt(rec[k], rec[ot])
+    return [
+        ("1. ข้อมูลทั่วไป (General Information)", [
+            ("1. วัน/เดือน/ปีเกิด:", dob),
+            ("2. เพศ:", rec['gender']),
+            ("3. ประเทศที่อยู่อาศัย:", t('country', 'country_ot')),
+            ("4. จังหวัดที่อยู่อาศัย:", t('province', 'province_ot')),
+            ("5. สัญชาติ:", t('nationality', 'nationality_ot')),
+            ("6. HN:", rec['hn']),
+            ("ชื่อ-นามสกุล:", rec['fname']),
+            ("7. น้ำหนัก:", f"{rec['weight']} กก."),
+            ("8. ส่วนสูง:", f"{rec['height']} ซม."),
+        ]),
+        ("2. ข้อมูลทางการแพทย์ (Medical)", [
+            ("9. โรคประจำตัว:", t('comorbidities', 'comorb_ot')),
+            ("10. สาเหตุการตัดขา:", t('cause', 'cause_ot')),
+            ("11. ปีที่ตัดขา:", rec['amp_year']),
+            ("12. ข้างที่ตัด:", rec['side']),
+            ("13. ระดับการตัดขา:", t('level', 'level_ot')),
+            ("14-15. ตอขา:", f"ยาว: {rec['stump_len']}, รูปทรง: {t('stump_shape', 'shape_ot')}"),
+            ("16. ผ่าตัดเพิ่มเติม:", f"{rec['surgery']} {rec['surg_details']}"),
+            ("17. K-Level ก่อนตัด:", rec['k_level']),
+        ]),
+        ("3-4. การฟื้นฟูและกายอุปกรณ์", [
+            ("18. บุคลากร:", t('personnel', 'personnel_ot')),
+            ("19. การฟื้นฟู:", f"{rec['rehab']} ({t('rehab_act', 'rehab_act_ot')})"),
+            ("20. การบริการ:", t('service', 'service_ot')),
+            ("21-22. วันที่:", f"หล่อแบบ: {rec['date_cast'] or '-'} / รับ: {rec['date_deliv'] or '-'}"),
+            ("23. Socket:", t('socket', 'socket_ot')),
+            ("24. Liner:", t('liner', 'liner_ot')),
+            ("25. Suspension:", t('suspension', 'susp_ot')),
+            ("26. Foot:", t('foot', 'foot_ot')),
+            ("27. Knee:", t('knee', 'knee_ot')),
+        ]),
+        ("5. สังคมและการใช้งาน", [
+            ("28. อุปกรณ์ช่วยเดิน:", t('assist', 'assist_ot')),
+            ("29. ยืน/เดิน (ต่อวัน):", f"{rec['stand_hr']} / {rec['walk_hr']}"),
+            ("30. ประวัติล้ม:", f"{rec['fall']} (บาดเจ็บ: {rec['fall_inj']})"),
+            ("31. สังคม:", f"ตนเอง: {rec['q31_1']} / เทียบคนอื่น: {rec['q31_2']}"),
+            ("32. งาน:", f"ตนเอง: {rec['q32_1']} / เทียบคนอื่น: {rec['q32_2']}"),
+            ("33. สนับสนุน:", f"ครอบครัว: {rec['supp_fam']} / องค์กร: {rec['supp_org']} ({t('supp_src', 'supp_src_ot')})"),
+        ]),
+    ]
+
+REPORT_TITLE = "แบบบันทึกข้อมูลกายอุปกรณ์ (Prosthesis Registry)"
+
+def printed_at():
+    return datetime.now().strftime('%d/%m/%Y %H:%M')
+
+# Compiled once per process; autoescape so free-text fields can't inject markup
+env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=True, trim_blocks=True, lstrip_blocks=True)
+TEMPLATE = env.get_template("report.html")
+
+# ---------------------------------------------------------
+# Sarabun for reports
+# ---------------------------------------------------------
+# Reports must render offline. A single report embeds a WOFF subset of Sarabun
+# holding only the characters its own text uses. Batch archives instead ship
+# one shared copy of each weight (printable ASCII + the Thai block) under
+# fonts/ and every report in the archive links to it, so the font bytes are
+# paid once per ZIP rather than once per patient.
+FONT_FILES = {400: "Sarabun-Regular.ttf", 700: "Sarabun-Bold.ttf"}
+FONT_MARKER = "/*@font-face*/"
+BASE_CHARS = "".join(chr(c) for lo, hi in [(0x20, 0x7E), (0x0E01, 0x0E5B)] for c in range(lo, hi + 1))
+LINKED_FONT_DIR = "fonts"  # relative to the report inside an archive
+# Used only while static/fonts has no Sarabun files (needs internet access)
+GOOGLE_FONTS_CSS = "https://fonts.googleapis.com/css2"
+
+@lru_cache(maxsize=256)
+def font_subset(weight, chars):
+    path = os.path.join(FONT_DIR, FONT_FILES[weight])
+    if not os.path.exists(path):
+        return None
+    font = TTFont(path)
+    options = Options()
+    options.flavor = 'woff'
+    options.layout_features = ['*']  # keep Thai mark positioning
+    sub = Subsetter(options)
+    sub.populate(text=chars)
+    sub.subset(font)
+    buf = io.BytesIO()
+    font.flavor = 'woff'
+    font.save(buf)
+    return buf.getvalue()
+
+def _woff_name(weight):
+    return FONT_FILES[weight].replace(".ttf", ".woff")
+
+def font_files():
+    # (archive path, bytes): the WOFF files create_html(..., linked_fonts=True)
+    # points at, plus the OFL text that has to travel with them
+    files = [(f"{LINKED_FONT_DIR}/{_woff_name(w)}", data)
+             for w in FONT_FILES if (data := font_subset(w, BASE_CHARS))]
+    if files:
+        with open(os.path.join(FONT_DIR, "OFL.txt"), "rb") as f:
+            files.append((f"{LINKED_FONT_DIR}/OFL.txt", f.read()))
+    return files
+
+def font_css(text, linked=False):
+    chars = "".join(sorted(set(text)))
+    rules = []
+    for weight in FONT_FILES:
+        if linked:
+            if not os.path.exists(os.path.join(FONT_DIR, FONT_FILES[weight])):
+                continue
+            src = f"url({LINKED_FONT_DIR}/{_woff_name(weight)})"
+        else:
+            data = font_subset(weight, chars)
+            if data is None:
+                continue
+            src = f"url(data:font/woff;base64,{base64.b64encode(data).decode('ascii')})"
+        rules.append(f"@font-face {{ font-family: 'Sarabun'; font-weight: {weight}; src: {src} format('woff'); }}")
+    if not rules:
+        return f"@import url('{GOOGLE_FONTS_CSS}?family=Sarabun:wght@400;700&display=swap');"
+    return "\n".join(rules)
+
+def create_html(rec, linked_fonts=False):
+    # linked_fonts: refer to fonts/*.woff next to the report instead of embedding a subset
+    html = TEMPLATE.render(rec=rec, title=REPORT_TITLE, sections=report_sections(rec), printed=printed_at())
+    body = html[html.index("<body>"):]
+    return html.replace(FONT_MARKER, font_css(body, linked_fonts), 1)
+
+# Record keys that appear in the report
+REPORT_KEYS = [
+    'hn', 'fname', 'dob', 'gender', 'country', 'country_ot', 'province', 'province_ot',
+    'nationality', 'nationality_ot', 'weight', 'height',
+    'comorbidities', 'comorb_ot', 'cause', 'cause_ot', 'amp_year', 'side', 'level', 'level_ot',
+    'stump_len', 'stump_shape', 'shape_ot', 'surgery', 'surg_details', 'k_level',
+    'personnel', 'personnel_ot', 'rehab', 'rehab_act', 'rehab_act_ot',
+    'service', 'service_ot', 'date_cast', 'date_deliv', 'socket', 'socket_ot', 'liner', 'liner_ot',
+    'suspension', 'susp_ot', 'foot', 'foot_ot', 'knee', 'knee_ot',
+    'assist', 'assist_ot', 'stand_hr', 'walk_hr', 'fall', 'fall_inj',
+    'q31_1', 'q31_2', 'q32_1', 'q32_2', 'supp_fam', 'supp_org', 'supp_src', 'supp_src_ot',
+    'tug_avg', 'tug_status',
+]
+
+def report_filename(rec, ext="html"):
+    # HNs are free text: keep the name one safe path component (ZIP entries,
+    # downloads). An HN that had to be altered gets a short hash of the original,
+    # so "A/1", "A 1" and "A_1" still end up with different names.
+    raw = str(rec['hn'])
+    hn = re.sub(r'\.{2,}', '.', re.sub(r'[^\w.-]+', '_', raw)).strip('._') or "unknown"
+    if hn != raw:
+        hn += "_" + hashlib.sha1(raw.encode('utf-8')).hexdigest()[:8]
+    return f"Report_{hn}.{ext}"
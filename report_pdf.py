@@ -0,0 +1,80 @@
+import os
+
+from fpdf import FPDF
+
+from report import FONT_DIR, REPORT_TITLE, printed_at, report_sections
+from tug_trends import TUG_THRESHOLD
+
+# ---------------------------------------------------------
+# PDF version of the HTML report (fpdf2, fully offline)
+# ---------------------------------------------------------
+# Same content as create_html(), laid out for A4. Thai needs HarfBuzz shaping
+# (uharfbuzz) so vowels and tone marks sit correctly.
+PDF_FONTS = {'': "Sarabun-Regular.ttf", 'B': "Sarabun-Bold.ttf"}
+
+BLUE = (31, 97, 141)
+NAVY = (21, 67, 96)
+GREY_BG = (248, 249, 250)
+RED = (192, 57, 43)
+GREEN = (39, 174, 96)
+
+def _status_text(status):
+    # The status strings start with an emoji that Sarabun has no glyph for
+    return status.replace("⚠️", "").replace("✅", "").strip()
+
+def missing_fonts():
+    return [p for p in (os.path.join(FONT_DIR, name) for name in PDF_FONTS.values()) if not os.path.exists(p)]
+
+def create_pdf(rec):
+    missing = missing_fonts()
+    if missing:
+        raise FileNotFoundError(f"PDF export needs {', '.join(missing)} (see README: Fonts)")
+    pdf = FPDF(format="A4")
+    pdf.set_margins(15, 15, 15)
+    for style, name in PDF_FONTS.items():
+        pdf.add_font("Sarabun", style, os.path.join(FONT_DIR, name))
+    pdf.set_text_shaping(True)
+    pdf.add_page()
+
+    pdf.set_font("Sarabun", "", 9)
+    pdf.cell(0, 5, f"พิมพ์เมื่อ: {printed_at()}", align="R", new_x="LMARGIN", new_y="NEXT")
+    pdf.set_font("Sarabun", "B", 18)
+    pdf.set_text_color(*BLUE)
+    pdf.cell(0, 12, REPORT_TITLE, align="C", new_x="LMARGIN", new_y="NEXT")
+    pdf.set_draw_color(*BLUE)
+    pdf.set_line_width(0.6)
+    pdf.line(pdf.l_margin, pdf.get_y(), pdf.w - pdf.r_margin, pdf.get_y())
+    pdf.set_line_width(0.2)
+
+    for head, rows in report_sections(rec):
+        pdf.ln(5)
+        pdf.set_font("Sarabun", "B", 12)
+        pdf.set_text_color(*NAVY)
+        pdf.set_fill_color(*GREY_BG)
+        pdf.cell(0, 8, head, fill=True, new_x="LMARGIN", new_y="NEXT")
+        pdf.set_text_color(51, 51, 51)
+        pdf.set_draw_color(238, 238, 238)
+        with pdf.table(col_widths=(35, 65), first_row_as_headings=False,
+                       borders_layout="HORIZONTAL_LINES", line_height=6) as table:
+            for label, value in rows:
+                row = table.row()
+                pdf.set_font("Sarabun", "B", 10)
+                row.cell(label)
+                pdf.set_font("Sarabun", "", 10)
+                row.cell(str(value))
+
+    # TUG result box
+    pdf.ln(6)
+    avg = rec['tug_avg']
+    pdf.set_draw_color(*BLUE)
+    pdf.set_line_width(0.6)
+    pdf.set_text_color(*BLUE)
+    pdf.set_font("Sarabun", "B", 13)
+    pdf.cell(0, 9, "ผลการทดสอบ TUG", border="LTR", align="C", new_x="LMARGIN", new_y="NEXT")
+    pdf.set_font("Sarabun", "B", 22)
+    pdf.cell(0, 12, f"{avg:.2f} s", border="LR", align="C", new_x="LMARGIN", new_y="NEXT")
+    pdf.set_font("Sarabun", "B", 14)
+    if avg > 0:
+        pdf.set_text_color(*(RED if avg >= TUG_THRESHOLD else GREEN))
+    pdf.cell(0, 10, _status_text(rec['tug_status']), border="LRB", align="C", new_x="LMARGIN", new_y="NEXT")
+    return bytes(pdf.output())
@@ -0,0 +1,116 @@
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from datetime import date
+from itertools import islice
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from registry_schema import DATE_KEYS, MULTI_KEYS, OPTIONS
+
+# ---------------------------------------------------------
+# De-identified research extract (Parquet / Arrow IPC)
+# ---------------------------------------------------------
+# Records are read and written BATCH_ROWS at a time, so memory is bounded by one
+# batch whatever the registry size. Per row:
+#   hn    -> pid, a keyed hash (HMAC-SHA256). With REGISTRY_PSEUDONYM_KEY set,
+#            the same patient gets the same pid in every extract; without it a
+#            random key is used and pids only link rows within one file.
+#   fname, age and every free-text "Other" box -> dropped
+#   dob   -> age band at the delivery date
+#   date_cast, date_deliv -> month only (stored as the 1st of the month)
+#   multiselects -> one boolean column per option ("foot.Other", ...)
+#   single choices -> dictionary-encoded with the form's option list
+#                     (categoricals in pandas)
+# Still quasi-identifying, alone or combined: province, age band, amp_year,
+# month of casting/delivery, and rarely chosen options (a small cohort in a
+# rare cell can single a patient out). Share extracts under a data-use
+# agreement, not publicly.
+BATCH_ROWS = 5000
+PSEUDONYM_KEY = os.environ.get("REGISTRY_PSEUDONYM_KEY")
+AGE_BANDS = ["<20", "20-29", "30-39", "40-49", "50-59", "60-69", "70-79", "80+"]
+TUG_STATUSES = ["-", "✅ Normal Mobility", "⚠️ High Fall Risk"]
+
+SINGLE_KEYS = [k for k in OPTIONS if k not in MULTI_KEYS]
+FLOAT_KEYS = ['weight', 'height', 't1', 't2', 't3', 'tug_avg']
+CATEGORIES = {**{k: OPTIONS[k] for k in SINGLE_KEYS}, 'age_band': AGE_BANDS, 'tug_status': TUG_STATUSES}
+
+def pseudonym(hn, key):
+    return hmac.new(key, str(hn).encode('utf-8'), hashlib.sha256).hexdigest()[:16]
+
+def age_band(dob, at):
+    if not isinstance(dob, date):
+        return None
+    at = at if isinstance(at, date) else date.today()
+    age = at.year - dob.year - ((at.month, at.day) < (dob.month, dob.day))
+    if age < 0:
+        return None
+    return AGE_BANDS[min(max(age // 10 - 1, 0), len(AGE_BANDS) - 1)]
+
+def month(d):
+    return d.replace(day=1) if isinstance(d, date) else None
+
+def research_schema():
+    fields = [pa.field('pid', pa.string())]
+    fields += [pa.field(k, pa.dictionary(pa.int8(), pa.string())) for k in CATEGORIES]
+    fields += [pa.field(k, pa.float32()) for k in FLOAT_KEYS]
+    fields += [pa.field('amp_year', pa.int16())]
+    fields += [pa.field(k, pa.date32()) for k in DATE_KEYS if k != 'dob']
+    fields += [pa.field(f"{k}.{opt}", pa.bool_()) for k in MULTI_KEYS for opt in OPTIONS[k]]
+    return pa.schema(fields)
+
+def _categorical(values, options):
+    # Same dictionary in every batch; values outside the option list become null
+    index = {o: i for i, o in enumerate(options)}
+    return pa.DictionaryArray.from_arrays(
+        pa.array([index.get(v) for v in values], type=pa.int8()), pa.array(options, type=pa.string()))
+
+def _num(v):
+    return v if isinstance(v, (int, float)) and not isinstance(v, bool) else None
+
+def to_batch(records, key, schema):
+    cols = {'pid': pa.array([pseudonym(r['hn'], key) for r in records], type=pa.string())}
+    derived = {
+        'age_band': [age_band(r.get('dob'), r.get('date_deliv')) for r in records],
+        'tug_status': [r.get('tug_status') for r in records],
+    }
+    for k, options in CATEGORIES.items():
+        cols[k] = _categorical(derived[k] if k in derived else [r.get(k) for r in records], options)
+    for k in FLOAT_KEYS:
+        cols[k] = pa.array([_num(r.get(k)) for r in records], type=pa.float32())
+    cols['amp_year'] = pa.array([_num(r.get('amp_year')) for r in records], type=pa.int16())
+    for k in DATE_KEYS:
+        if k != 'dob':
+            cols[k] = pa.array([month(r.get(k)) for r in records], type=pa.date32())
+    for k in MULTI_KEYS:
+        picked = [set(r.get(k) or ()) for r in records]
+        for opt in OPTIONS[k]:
+            cols[f"{k}.{opt}"] = pa.array([opt in p for p in picked], type=pa.bool_())
+    return pa.RecordBatch.from_arrays([cols[f.name] for f in schema], schema=schema)
+
+def export_research(records, out, fmt="parquet", key=None, batch_size=BATCH_ROWS, on_progress=None):
+    # `records`: any iterable of full record dicts; `out`: a path or binary file
+    key = key or (PSEUDONYM_KEY.encode('utf-8') if PSEUDONYM_KEY else secrets.token_bytes(32))
+    schema = research_schema()
+    records = iter(records)
+    n, t0 = 0, time.perf_counter()
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(out, schema, compression="zstd")
+    elif fmt == "arrow":
+        writer = pa.ipc.new_file(out, schema)
+    else:
+        raise ValueError(f"unknown format {fmt!r} (use 'parquet' or 'arrow')")
+    with writer:
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                break
+            writer.write_batch(to_batch(batch, key, schema))
+            n += len(batch)
+            if on_progress:
+                on_progress(n)
+    elapsed = time.perf_counter() - t0
+    return {'rows': n, 'seconds': elapsed, 'per_second': n / elapsed if elapsed else 0.0}
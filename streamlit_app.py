@@ -1,18 +1,45 @@
 import streamlit as st
+import streamlit.components.v1 as components
+import os
 import time
-import io
-from datetime import datetime, date
+import hashlib
+from collections import OrderedDict
+from datetime import date
+from registry_schema import OPTIONS, record_defaults
+from registry_store import ConflictError, RegistryStore
+from patient_index import PatientIndex
+from pdf_queue import PdfQueue
+from report_pdf import missing_fonts
+from report import FONT_DIR, GOOGLE_FONTS_CSS, REPORT_KEYS, create_html, printed_at, report_filename
+from batch_export import export_zip, new_export, start_sweeper
+from bulk_import import import_file
+from research_export import export_research
+from cohort import Cohort
+from drafts import AUTOSAVE_SECONDS, DraftAutosave, new_draft_id
+from profiling import ENABLED as PROFILING, METRICS_PATH, PROFILER, begin_run, end_run, span, timed
+from tug_trends import TUG_THRESHOLD, pack_session, unpack_history, tug_trends
 
 # ---------------------------------------------------------
 # 1. SETUP & MODERN UI STYLING
 # ---------------------------------------------------------
 st.set_page_config(page_title="Prosthesis Registry", layout="wide", page_icon="🦿")
+begin_run()  # profiling (opt-in, see profiling.py)
 
-st.markdown("""
+# Local Sarabun (static/fonts, served by Streamlit static serving; works offline).
+# Until the font files are installed, fall back to Google Fonts as before.
+APP_FONTS = {300: ("Sarabun Light", "Sarabun-Light.ttf"), 400: ("Sarabun", "Sarabun-Regular.ttf"),
+             600: ("Sarabun SemiBold", "Sarabun-SemiBold.ttf"), 700: ("Sarabun Bold", "Sarabun-Bold.ttf")}
+if all(os.path.exists(os.path.join(FONT_DIR, f)) for _, f in APP_FONTS.values()):
+    APP_FONT_CSS = "\n".join(
+        f"@font-face {{ font-family: 'Sarabun'; font-weight: {w}; src: local('{name}'), url('app/static/fonts/{f}') format('truetype'); }}"
+        for w, (name, f) in APP_FONTS.items())
+else:
+    APP_FONT_CSS = f"@import url('{GOOGLE_FONTS_CSS}?family=Sarabun:wght@300;400;600&display=swap');"
+
+with span("css"):
+    st.markdown(f"<style>{APP_FONT_CSS}</style>", unsafe_allow_html=True)
+    st.markdown("""
     <style>
-    /* Import Font */
-    @import url('https://fonts.googleapis.com/css2?family=Sarabun:wght@300;400;600&display=swap');
-    
     html, body, [class*="css"] {
         font-family: 'Sarabun', sans-serif;
         background-color: #f8f9fa;
@@ -63,63 +90,21 @@ st.markdown("""
 # ---------------------------------------------------------
 # 2. SESSION STATE MANAGEMENT
 # ---------------------------------------------------------
-if 'init' not in st.session_state:
-    # Default values matching PDF structure
-    defaults = {
-        # 1. General Info (PDF Items 1-8)
-        'hn': '', 'fname': '', 
-        'dob': date(1980, 1, 1), 'age': 0,
-        'gender': 'ชาย', 
-        'country': 'Thailand', 'country_ot': '',
-        'province': 'กรุงเทพมหานคร', 'province_ot': '',
-        'nationality': 'ไทย', 'nationality_ot': '',
-        'weight': 0.0, 'height': 0.0,
-        
-        # 2. Medical (PDF Items 9-17)
-        'comorbidities': [], 'comorb_ot': '',
-        'cause': 'อุบัติเหตุ', 'cause_ot': '',
-        'amp_year': 2560, 'side': 'ขวา',
-        'level': 'Transtibial', 'level_ot': '',
-        'stump_len': 'ปานกลาง', 
-        'stump_shape': 'Cylindrical', 'shape_ot': '',
-        'surgery': 'ไม่ใช่', 'surg_details': [],
-        'k_level': 'K1',
-        
-        # 3. Rehab (PDF Items 18-19)
-        'personnel': [], 'personnel_ot': '',
-        'rehab': 'ไม่เคย', 'rehab_act': [], 'rehab_act_ot': '',
-        
-        # 4. Prosthesis (PDF Items 20-27)
-        'service': [], 'service_ot': '',
-        'date_cast': date.today(), 'date_deliv': date.today(),
-        'socket': 'PTB', 'socket_ot': '',
-        'liner': 'None', 'liner_ot': '',
-        'suspension': [], 'susp_ot': '',
-        'foot': [], 'foot_ot': '',
-        'knee': [], 'knee_ot': '', # Only for Transfemoral+
-        
-        # 5. Social (PDF Items 28-33)
-        'assist': 'ไม่ใช้', 'assist_ot': '',
-        'stand_hr': '1-3 ชั่วโมง', 'walk_hr': '1-3 ชั่วโมง',
-        'fall': 'ไม่', 'fall_freq': '', 'fall_inj': 'ไม่',
-        'q31_1': 'ไม่มีปัญหา (0-4%)', 'q31_2': 'ไม่มีปัญหา (0-4%)',
-        'q32_1': 'ไม่มีปัญหา (0-4%)', 'q32_2': 'ไม่มีปัญหา (0-4%)',
-        'supp_fam': 'ใช่', 'supp_org': 'ไม่ใช่', 
-        'supp_src': [], 'supp_src_ot': '',
-        
-        # TUG
-        'tug_running': False, 'start_time': None,
-        't1': 0.0, 't2': 0.0, 't3': 0.0, 'tug_avg': 0.0, 'tug_status': '-'
-    }
-    for k, v in defaults.items():
-        st.session_state[k] = v
-    st.session_state.init = True
+defaults = {
+    **record_defaults(),
+    # TUG timer/UI state (not part of a saved record)
+    'tug_mode': 'Browser', 'tug_last_stop': None,
+    'tug_running': False, 'start_time': None,
+}
+RECORD_KEYS = list(record_defaults())
 
-# Helper to get "Other" text
-def get_txt(val, ot_key):
-    if val == "Other" or val == "อื่นๆ" or (isinstance(val, list) and ("Other" in val or "อื่นๆ" in val)):
-        return f"{val} ({st.session_state[ot_key]})"
-    return str(val)
+if 'init' not in st.session_state:
+    with span("session_init"):
+        for k, v in defaults.items():
+            st.session_state[k] = v
+        st.session_state.report_cache = OrderedDict()
+        st.session_state.record = {}
+        st.session_state.init = True
 
 # TUG Logic
 def calculate_tug():
@@ -127,11 +112,31 @@ def calculate_tug():
     if times:
         avg = sum(times) / len(times)
         st.session_state.tug_avg = avg
-        st.session_state.tug_status = "⚠️ High Fall Risk" if avg >= 13.5 else "✅ Normal Mobility"
+        st.session_state.tug_status = "⚠️ High Fall Risk" if avg >= TUG_THRESHOLD else "✅ Normal Mobility"
     else:
         st.session_state.tug_avg = 0.0
         st.session_state.tug_status = "-"
 
+def add_trial(fin):
+    if st.session_state.t1 == 0: st.session_state.t1 = fin
+    elif st.session_state.t2 == 0: st.session_state.t2 = fin
+    elif st.session_state.t3 == 0: st.session_state.t3 = fin
+    calculate_tug()
+
+# Browser stopwatch: runs client-side, only reports {start, stop, elapsed} on STOP
+tug_timer = components.declare_component(
+    "tug_timer", path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "components", "tug_timer")
+)
+
+def record_tug_browser():
+    res = st.session_state.tug_browser
+    # The component keeps returning its last value; only count each STOP once
+    if not res or res.get('stop') == st.session_state.tug_last_stop:
+        return
+    st.session_state.tug_last_stop = res.get('stop')
+    fin = res.get('elapsed') or (res['stop'] - res['start']) / 1000
+    add_trial(round(float(fin), 2))
+
 def reset_tug():
     st.session_state.t1 = 0.0
     st.session_state.t2 = 0.0
@@ -141,100 +146,205 @@ def reset_tug():
     st.session_state.tug_running = False
 
 # ---------------------------------------------------------
-# 3. HTML REPORT GENERATOR
+# PERSISTENCE (SQLite, shared by all sessions and by every app process using
+# the same REGISTRY_DB; session state only holds the form being edited)
 # ---------------------------------------------------------
-def create_html():
-    dob = st.session_state.dob.strftime('%d/%m/%Y')
-    today = date.today().strftime('%d/%m/%Y')
-    
-    # Calculate Age logic (if needed for display update)
-    age_calc = date.today().year - st.session_state.dob.year
-    
-    html = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <link href="https://fonts.googleapis.com/css2?family=Sarabun:wght@400;700&display=swap" rel="stylesheet">
-        <style>
-            body {{ font-family: 'Sarabun', sans-serif; padding: 40px; color: #333; }}
-            h1 {{ text-align: center; border-bottom: 2px solid #1F618D; padding-bottom: 10px; color: #1F618D; }}
-            .section {{ margin-top: 25px; background: #f8f9fa; padding: 15px; border-radius: 8px; }}
-            .sec-head {{ color: #154360; font-weight: bold; font-size: 1.1em; margin-bottom: 10px; border-left: 4px solid #154360; padding-left: 8px; }}
-            table {{ width: 100%; border-collapse: collapse; }}
-            td {{ padding: 6px; border-bottom: 1px solid #eee; vertical-align: top; }}
-            .lbl {{ font-weight: bold; width: 35%; color: #555; }}
-            .tug-box {{ text-align: center; border: 2px solid #1F618D; padding: 15px; margin-top: 20px; border-radius: 10px; }}
-        </style>
-    </head>
-    <body>
-        <div style="text-align:right; font-size:0.8em;">พิมพ์เมื่อ: {datetime.now().strftime('%d/%m/%Y %H:%M')}</div>
-        <h1>แบบบันทึกข้อมูลกายอุปกรณ์ (Prosthesis Registry)</h1>
-        
-        <div class="section">
-            <div class="sec-head">1. ข้อมูลทั่วไป (General Information)</div>
-            <table>
-                <tr><td class="lbl">1. วัน/เดือน/ปีเกิด:</td><td>{dob} (อายุ {age_calc} ปี)</td></tr>
-                <tr><td class="lbl">2. เพศ:</td><td>{st.session_state.gender}</td></tr>
-                <tr><td class="lbl">3. ประเทศที่อยู่อาศัย:</td><td>{get_txt(st.session_state.country, 'country_ot')}</td></tr>
-                <tr><td class="lbl">4. จังหวัดที่อยู่อาศัย:</td><td>{get_txt(st.session_state.province, 'province_ot')}</td></tr>
-                <tr><td class="lbl">5. สัญชาติ:</td><td>{get_txt(st.session_state.nationality, 'nationality_ot')}</td></tr>
-                <tr><td class="lbl">6. HN:</td><td>{st.session_state.hn}</td></tr>
-                <tr><td class="lbl">ชื่อ-นามสกุล:</td><td>{st.session_state.fname}</td></tr>
-                <tr><td class="lbl">7. น้ำหนัก:</td><td>{st.session_state.weight} กก.</td></tr>
-                <tr><td class="lbl">8. ส่วนสูง:</td><td>{st.session_state.height} ซม.</td></tr>
-            </table>
-        </div>
+@st.cache_resource
+def get_store():
+    return RegistryStore()
 
-        <div class="section">
-            <div class="sec-head">2. ข้อมูลทางการแพทย์ (Medical)</div>
-            <table>
-                <tr><td class="lbl">9. โรคประจำตัว:</td><td>{get_txt(st.session_state.comorbidities, 'comorb_ot')}</td></tr>
-                <tr><td class="lbl">10. สาเหตุการตัดขา:</td><td>{get_txt(st.session_state.cause, 'cause_ot')}</td></tr>
-                <tr><td class="lbl">11. ปีที่ตัดขา:</td><td>{st.session_state.amp_year}</td></tr>
-                <tr><td class="lbl">12. ข้างที่ตัด:</td><td>{st.session_state.side}</td></tr>
-                <tr><td class="lbl">13. ระดับการตัดขา:</td><td>{get_txt(st.session_state.level, 'level_ot')}</td></tr>
-                <tr><td class="lbl">14-15. ตอขา:</td><td>ยาว: {st.session_state.stump_len}, รูปทรง: {get_txt(st.session_state.stump_shape, 'shape_ot')}</td></tr>
-                <tr><td class="lbl">16. ผ่าตัดเพิ่มเติม:</td><td>{st.session_state.surgery} {st.session_state.surg_details}</td></tr>
-                <tr><td class="lbl">17. K-Level ก่อนตัด:</td><td>{st.session_state.k_level}</td></tr>
-            </table>
-        </div>
+@st.cache_resource(show_spinner="กำลังโหลดข้อมูลทะเบียน...")
+def load_cohort():
+    # One full scan per process; afterwards kept current by save_record_cb
+    return Cohort.from_store(get_store())
 
-        <div class="section">
-            <div class="sec-head">3-4. การฟื้นฟูและกายอุปกรณ์</div>
-            <table>
-                <tr><td class="lbl">18. บุคลากร:</td><td>{get_txt(st.session_state.personnel, 'personnel_ot')}</td></tr>
-                <tr><td class="lbl">19. การฟื้นฟู:</td><td>{st.session_state.rehab} ({get_txt(st.session_state.rehab_act, 'rehab_act_ot')})</td></tr>
-                <tr><td class="lbl">20. การบริการ:</td><td>{get_txt(st.session_state.service, 'service_ot')}</td></tr>
-                <tr><td class="lbl">21-22. วันที่:</td><td>หล่อแบบ: {st.session_state.date_cast} / รับ: {st.session_state.date_deliv}</td></tr>
-                <tr><td class="lbl">23. Socket:</td><td>{get_txt(st.session_state.socket, 'socket_ot')}</td></tr>
-                <tr><td class="lbl">24. Liner:</td><td>{get_txt(st.session_state.liner, 'liner_ot')}</td></tr>
-                <tr><td class="lbl">25. Suspension:</td><td>{get_txt(st.session_state.suspension, 'susp_ot')}</td></tr>
-                <tr><td class="lbl">26. Foot:</td><td>{get_txt(st.session_state.foot, 'foot_ot')}</td></tr>
-                <tr><td class="lbl">27. Knee:</td><td>{get_txt(st.session_state.knee, 'knee_ot')}</td></tr>
-            </table>
-        </div>
+@st.cache_resource(show_spinner="กำลังสร้างดัชนีค้นหา...")
+def load_patient_index():
+    # HN / name lookup for the search box; kept current on save and import
+    return PatientIndex.from_store(get_store())
 
-        <div class="section">
-            <div class="sec-head">5. สังคมและการใช้งาน</div>
-            <table>
-                <tr><td class="lbl">28. อุปกรณ์ช่วยเดิน:</td><td>{get_txt(st.session_state.assist, 'assist_ot')}</td></tr>
-                <tr><td class="lbl">29. ยืน/เดิน (ต่อวัน):</td><td>{st.session_state.stand_hr} / {st.session_state.walk_hr}</td></tr>
-                <tr><td class="lbl">30. ประวัติล้ม:</td><td>{st.session_state.fall} (บาดเจ็บ: {st.session_state.fall_inj})</td></tr>
-                <tr><td class="lbl">31. สังคม:</td><td>ตนเอง: {st.session_state.q31_1} / เทียบคนอื่น: {st.session_state.q31_2}</td></tr>
-                <tr><td class="lbl">32. งาน:</td><td>ตนเอง: {st.session_state.q32_1} / เทียบคนอื่น: {st.session_state.q32_2}</td></tr>
-                <tr><td class="lbl">33. สนับสนุน:</td><td>ครอบครัว: {st.session_state.supp_fam} / องค์กร: {st.session_state.supp_org} ({get_txt(st.session_state.supp_src, 'supp_src_ot')})</td></tr>
-            </table>
-        </div>
+# Both also pick up records saved by other app processes since the last call
+def get_cohort():
+    return load_cohort().refresh(get_store())
 
-        <div class="tug-box">
-            <h3>ผลการทดสอบ TUG</h3>
-            <h1>{st.session_state.tug_avg:.2f} s</h1>
-            <h2>{st.session_state.tug_status}</h2>
-        </div>
-    </body>
-    </html>
-    """
-    return html
+def get_patient_index():
+    return load_patient_index().refresh(get_store())
+
+def records_saved(records):
+    get_cohort().upsert_many(records)
+    get_patient_index().upsert_many(records)
+
+def current_record():
+    return {k: st.session_state.get(k, defaults[k]) for k in RECORD_KEYS}
+
+def save_record_cb():
+    if not st.session_state.hn:
+        st.toast("กรุณากรอก HN ก่อนบันทึก", icon="⚠️")
+        return
+    rec = current_record()
+    draft = st.session_state.draft
+    # Optimistic concurrency: the save only goes through if the record is still at
+    # the version this form was loaded from (or, for a new HN, doesn't exist yet)
+    try:
+        version = get_store().save(rec, version=draft.base_version if draft.base_hn == rec['hn'] else 0)
+    except ConflictError as e:
+        msg = "มีอยู่แล้ว" if e.expected == 0 else "ถูกแก้ไขโดยผู้ใช้อื่น"
+        st.toast(f"HN {rec['hn']} {msg} กรุณาโหลดข้อมูลล่าสุดก่อนบันทึก", icon="⚠️")
+        return
+    records_saved([rec])
+    get_store().delete_draft(draft.draft_id)
+    draft.rebase(rec, rec['hn'], version)
+    st.toast(f"บันทึก HN {st.session_state.hn} แล้ว", icon="✅")
+
+def load_record_cb():
+    hn = st.session_state.load_hn.strip()
+    rec, version = get_store().load_versioned(hn) if hn else (None, 0)
+    if rec is None:
+        st.toast(f"ไม่พบ HN {hn}", icon="⚠️")
+        return
+    # Runs before any widget is created, so widget keys can be overwritten
+    for k in RECORD_KEYS:
+        st.session_state[k] = rec.get(k, defaults[k])
+    # Loading discards this tab's unsaved edits; someone's unsaved edits to this HN are picked up
+    draft = st.session_state.draft
+    get_store().delete_draft(draft.draft_id)
+    draft.rebase(current_record(), hn, version)
+    found = get_store().latest_draft(hn, version)
+    if found is not None:
+        for k, v in found['delta'].items():
+            if k in defaults:
+                st.session_state[k] = v
+        st.toast(f"โหลด HN {hn} พร้อมข้อมูลที่ยังไม่ได้บันทึก", icon="♻️")
+    else:
+        st.toast(f"โหลด HN {hn} แล้ว", icon="📂")
+
+# Drafts: this tab's id is kept in the URL, so a refresh or reconnect finds it again
+def start_draft():
+    store = get_store()
+    draft_id = st.query_params.get("draft") or new_draft_id()
+    st.query_params["draft"] = draft_id
+    found = store.load_draft(draft_id)
+    if found is None:
+        st.session_state.draft = DraftAutosave(draft_id, current_record())
+        return
+    base = (store.load(found['base_hn']) if found['base_hn'] else None) or {}
+    for k in RECORD_KEYS:
+        st.session_state[k] = found['delta'].get(k, base.get(k, defaults[k]))
+    st.session_state.draft = DraftAutosave(draft_id, current_record(), found['base_hn'], found['base_version'])
+    st.toast("กู้คืนข้อมูลที่ยังไม่ได้บันทึกแล้ว", icon="♻️")
+
+if 'draft' not in st.session_state:
+    start_draft()
+
+# Only this fragment reruns on the timer; a write happens once typing pauses
+@st.fragment(run_every=AUTOSAVE_SECONDS)
+@timed("draft_autosave")
+def draft_autosave():
+    draft = st.session_state.draft
+    draft.tick(get_store(), current_record())
+    if draft.last_write:
+        s = draft.stats()
+        st.caption(f"📝 ร่างอัตโนมัติ {time.strftime('%H:%M:%S', time.localtime(draft.last_write))} · "
+                   f"{s['writes']} ครั้ง / {s['fields']} ช่อง / {s['bytes'] / 1024:.1f} KB · {s['ms_per_tick']:.2f} ms/รอบ")
+
+def pick_patient_cb(hn):
+    st.session_state.load_hn = hn
+    load_record_cb()
+    st.session_state.search_loaded = True
+
+# Typing only reruns this fragment; picking a patient reloads the whole form
+@st.fragment
+@timed("patient_search")
+def patient_search():
+    if st.session_state.pop('search_loaded', False):
+        st.rerun(scope="app")
+    q = st.text_input("🔍 ค้นหาผู้ป่วย", key="patient_query", type="search", live="150ms",
+                      placeholder="HN หรือ ชื่อ-นามสกุล")
+    if not q:
+        return
+    hits = get_patient_index().search(q)
+    if not hits:
+        st.caption("ไม่พบผู้ป่วย")
+    for hn, fname in hits:
+        st.button(f"{hn} · {fname}" if fname else hn, key=f"pick_{hn}", on_click=pick_patient_cb,
+                  args=(hn,), width="stretch")
+
+# ---------------------------------------------------------
+# 3. HTML REPORT (rendering itself lives in report.py)
+# ---------------------------------------------------------
+REPORT_CACHE_SIZE = 4  # reports kept per session
+
+def sync_record():
+    # Copy the report fields into a plain dict that outlives the current run, so a
+    # deferred download sees edits made in fragment reruns. Widgets that are hidden
+    # (e.g. an unused "Other" box) lose their key, so fall back to the default.
+    rec = st.session_state.record
+    for k in REPORT_KEYS:
+        rec[k] = st.session_state.get(k, defaults[k])
+    return rec
+
+def report_digest(rec):
+    # The report prints its time (to the minute) and an age as of today, so
+    # both are part of the key: a cached copy never shows a stale print time
+    return hashlib.sha1(repr([printed_at()] + [rec[k] for k in REPORT_KEYS]).encode('utf-8')).hexdigest()
+
+def get_report(rec, cache):
+    # Render only on demand; unchanged records are served from the per-session LRU cache.
+    # May run on the download thread, so it only touches `rec` and `cache`, never st.*
+    digest = report_digest(rec)
+    if digest in cache:
+        cache.move_to_end(digest)
+        return cache[digest]
+    with span("create_html"):
+        data = create_html(rec).encode('utf-8')
+    cache[digest] = data
+    while len(cache) > REPORT_CACHE_SIZE:
+        cache.popitem(last=False)
+    return data
+
+# Exports under static/exports are deleted EXPORT_TTL after creation by one
+# background sweeper per process, even if nobody exports again
+@st.cache_resource
+def export_sweeper():
+    return start_sweeper()
+
+# PDF export: rendered on the process-wide background queue, polled by a small
+# fragment; finished PDFs are shared with the other app processes via the store
+@st.cache_resource
+def get_pdf_queue():
+    return PdfQueue(get_store())
+
+def request_pdf_cb():
+    rec = sync_record()
+    if missing_fonts():
+        # No Sarabun TTFs for fpdf2 yet: print the HTML report to PDF in the browser
+        st.session_state.pdf_print = True
+        return
+    st.session_state.pdf_version = report_digest(rec)
+    st.session_state.pdf_name = report_filename(rec, "pdf")
+    get_pdf_queue().submit(rec, st.session_state.pdf_version)
+
+def pdf_status():
+    version = st.session_state.get('pdf_version')
+    return get_pdf_queue().status(version) if version else (None, None)
+
+def pdf_panel():
+    state, data = pdf_status()
+    if state == 'pending':
+        st.caption("⏳ กำลังสร้าง PDF...")
+    elif state == 'done':
+        st.download_button("⬇️ Download PDF", data, file_name=st.session_state.pdf_name,
+                           mime="application/pdf", on_click="ignore", width="stretch")
+    elif state == 'error':
+        st.error(data)
+
+# Only polls (once a second, this fragment only) while a PDF is being rendered
+@st.fragment(run_every=1)
+@timed("pdf_panel_polling")
+def pdf_panel_polling():
+    if pdf_status()[0] != 'pending':
+        st.rerun(scope="app")
+    pdf_panel()
 
 # ---------------------------------------------------------
 # 4. APP LAYOUT
@@ -242,182 +352,398 @@ def create_html():
 st.title("🏥 Prosthesis Registry & OM Platform")
 
 # Sidebar
+st.sidebar.markdown("### 🗄️ Registry")
+st.sidebar.button("💾 Save Record", key="save_btn", on_click=save_record_cb, type="primary", width="stretch")
+with st.sidebar:
+    draft_autosave()
+    patient_search()
+st.sidebar.text_input("HN", key="load_hn", placeholder="HN ที่ต้องการโหลด")
+st.sidebar.button("📂 Load Record", key="load_btn", on_click=load_record_cb, width="stretch")
+with st.sidebar.expander("📤 Bulk Import (CSV/XLSX)"):
+    upload = st.file_uploader("ไฟล์ข้อมูลย้อนหลัง", type=["csv", "xlsx"], key="import_file")
+    if upload is not None and st.button("นำเข้าข้อมูล", key="import_btn", width="stretch"):
+        bar = st.progress(0.0)
+        def show_progress(frac, ok, bad):
+            bar.progress(frac, text=f"นำเข้า {ok:,} / ปฏิเสธ {bad:,} แถว")
+        with span("bulk_import"):
+            n_ok, rejected = import_file(upload, upload.name, get_store(),
+                                         on_progress=show_progress, on_batch=records_saved)
+        st.success(f"นำเข้าสำเร็จ {n_ok:,} รายการ")
+        if len(rejected):
+            st.warning(f"ปฏิเสธ {len(rejected):,} แถว")
+            st.download_button("⬇️ Rejected rows (CSV)", rejected.to_csv(index=False).encode('utf-8-sig'),
+                               file_name=f"rejected_{upload.name}.csv", mime="text/csv", width="stretch")
+export_sweeper()
+with st.sidebar.expander("🗂️ Batch Export (ZIP)"):
+    exp_level = st.selectbox("ระดับการตัดขา", ["ทั้งหมด"] + OPTIONS['level'], key="export_level")
+    exp_dates = st.date_input("วันที่ได้รับกายอุปกรณ์", value=(), key="export_dates")
+    if st.button("สร้างรายงานทั้งหมด", key="export_btn", width="stretch"):
+        filters = {
+            'level': None if exp_level == "ทั้งหมด" else exp_level,
+            'date_from': exp_dates[0] if len(exp_dates) > 0 else None,
+            'date_to': exp_dates[1] if len(exp_dates) > 1 else None,
+        }
+        total = get_store().count(**filters)
+        bar = st.progress(0.0)
+        def show_rate(n, rate):
+            bar.progress(min(n / max(total, 1), 1.0), text=f"{n:,}/{total:,} รายงาน ({rate:,.0f} รายงาน/วินาที)")
+        # Reports stream into a file under static/exports, which the browser then
+        # downloads straight from disk (the archive never passes through memory)
+        path, url = new_export(f"Reports_{date.today():%Y%m%d}.zip")
+        with span("batch_export"):
+            stats = export_zip(get_store().iter_records(**filters), path, on_progress=show_rate)
+        st.caption(f"{stats['reports']:,} รายงานใน {stats['seconds']:.1f} s ({stats['per_second']:,.0f} รายงาน/วินาที)")
+        st.link_button("⬇️ Download ZIP", url, width="stretch")
+with st.sidebar.expander("🔬 Research Export (de-identified)"):
+    res_fmt = st.radio("รูปแบบไฟล์", ["parquet", "arrow"], horizontal=True, key="research_fmt")
+    if st.button("สร้างไฟล์วิจัย", key="research_btn", width="stretch"):
+        total = get_store().count()
+        bar = st.progress(0.0)
+        # Served from disk like the ZIP export
+        path, url = new_export(f"Registry_research_{date.today():%Y%m%d}.{res_fmt}")
+        with span("research_export"):
+            stats = export_research(get_store().iter_records(), path, fmt=res_fmt,
+                                    on_progress=lambda n: bar.progress(min(n / max(total, 1), 1.0), text=f"{n:,}/{total:,} ราย"))
+        st.caption(f"{stats['rows']:,} รายใน {stats['seconds']:.1f} s")
+        st.link_button("⬇️ Download", url, width="stretch")
+with st.sidebar.expander("📋 Recent Records"):
+    with span("recent_records"):
+        st.dataframe(get_store().list_records(limit=20), hide_index=True, width="stretch")
+
 st.sidebar.markdown("### 📥 Report")
-html_data = create_html()
+report_rec = sync_record()
+report_cache = st.session_state.report_cache
 st.sidebar.download_button(
     "💾 Download HTML Report",
-    data=io.BytesIO(html_data.encode('utf-8')),
-    file_name=f"Report_{st.session_state.hn}.html",
+    data=lambda: get_report(report_rec, report_cache),
+    file_name=report_filename(report_rec),
     mime="text/html",
-    use_container_width=True
+    width="stretch"
 )
+if st.sidebar.toggle("👁️ Preview Report", key="report_preview"):
+    st.sidebar.iframe(get_report(report_rec, report_cache).decode('utf-8'), height=600)
+st.sidebar.button("🖨️ Create PDF", key="pdf_btn", on_click=request_pdf_cb, width="stretch")
+with st.sidebar:
+    if st.session_state.pop('pdf_print', False):
+        # One-shot: the iframe holds the report and opens the print dialog ("Save as PDF")
+        # once its fonts are loaded; it is gone again on the next rerun
+        st.iframe(get_report(report_rec, report_cache).decode('utf-8')
+                  + "<script>document.fonts.ready.then(() => window.print());</script>", height=1)
+    pdf_panel_polling() if pdf_status()[0] == 'pending' else pdf_panel()
 
-tab1, tab2 = st.tabs(["📝 Registry Form", "⏱️ TUG Test"])
+# Admin-only profiling panel: open the app with ?admin=<REGISTRY_ADMIN_TOKEN>
+ADMIN_TOKEN = os.environ.get("REGISTRY_ADMIN_TOKEN")
+if ADMIN_TOKEN and st.query_params.get("admin") == ADMIN_TOKEN:
+    with st.sidebar.expander("⏱️ Profiling (admin)"):
+        if not PROFILING:
+            st.caption("ปิดอยู่: ตั้งค่า REGISTRY_PROFILE=1 แล้วเริ่มแอปใหม่")
+        else:
+            runs = st.session_state.get("_prof_runs", {})
+            st.metric("Reruns (this session)", sum(runs.values()))
+            st.dataframe([{'scope': sc, 'trigger': tr, 'reruns': n} for (sc, tr), n in runs.items()],
+                         hide_index=True, width="stretch")
+            st.markdown("**Spans (all sessions)**")
+            st.dataframe(PROFILER.span_table(), hide_index=True, width="stretch")
+            st.markdown("**Reruns by trigger (all sessions)**")
+            st.dataframe(PROFILER.rerun_table(), hide_index=True, width="stretch")
+            st.caption(f"Prometheus: {METRICS_PATH}")
 
 # --- TAB 1: REGISTRY (Single Column, Card Style) ---
-with tab1:
-    
-    # --- Section 1: General ---
+# Each PDF section is its own fragment: editing a field reruns only that card.
+
+# --- Section 1: General ---
+@st.fragment
+@timed("section_general")
+def section_general():
     st.markdown('<div class="form-card">', unsafe_allow_html=True)
     st.markdown('<div class="section-title">1. ข้อมูลทั่วไป (General Info)</div>', unsafe_allow_html=True)
     
     col_g1, col_g2 = st.columns([1,1]) # Use columns for Name/HN to save slight space, but keep flow
-    st.session_state.hn = st.text_input("6. เลขประจำตัวผู้ป่วย (HN)", key="hn")
-    st.session_state.fname = st.text_input("ชื่อ-นามสกุล (Name)", key="fname")
+    st.text_input("6. เลขประจำตัวผู้ป่วย (HN)", key="hn")
+    st.text_input("ชื่อ-นามสกุล (Name)", key="fname")
     
-    st.session_state.dob = st.date_input("1. วัน/เดือน/ปีเกิด (Date of Birth)", key="dob")
+    st.date_input("1. วัน/เดือน/ปีเกิด (Date of Birth)", key="dob")
     # Auto calc age display
-    age_now = date.today().year - st.session_state.dob.year
-    st.caption(f"อายุปัจจุบัน: {age_now} ปี")
+    if st.session_state.dob:
+        age_now = date.today().year - st.session_state.dob.year
+        st.caption(f"อายุปัจจุบัน: {age_now} ปี")
     
-    st.session_state.gender = st.selectbox("2. เพศ (Gender)", ["ชาย", "หญิง"], key="gender")
+    st.selectbox("2. เพศ (Gender)", OPTIONS['gender'], key="gender")
     
-    st.session_state.country = st.selectbox("3. ประเทศที่อยู่อาศัย", ["Thailand", "Other"], key="country")
-    if st.session_state.country == "Other": st.session_state.country_ot = st.text_input("ระบุประเทศ", key="country_ot")
+    st.selectbox("3. ประเทศที่อยู่อาศัย", OPTIONS['country'], key="country")
+    if st.session_state.country == "Other": st.text_input("ระบุประเทศ", key="country_ot")
     
-    st.session_state.province = st.selectbox("4. จังหวัดที่อยู่อาศัย", ["กรุงเทพมหานคร", "เชียงใหม่", "ขอนแก่น", "ภูเก็ต", "Other"], key="province")
-    if st.session_state.province == "Other": st.session_state.province_ot = st.text_input("ระบุจังหวัด", key="province_ot")
+    st.selectbox("4. จังหวัดที่อยู่อาศัย", OPTIONS['province'], key="province")
+    if st.session_state.province == "Other": st.text_input("ระบุจังหวัด", key="province_ot")
     
-    st.session_state.nationality = st.selectbox("5. สัญชาติ", ["ไทย", "Other"], key="nationality")
-    if st.session_state.nationality == "Other": st.session_state.nationality_ot = st.text_input("ระบุสัญชาติ", key="nationality_ot")
+    st.selectbox("5. สัญชาติ", OPTIONS['nationality'], key="nationality")
+    if st.session_state.nationality == "Other": st.text_input("ระบุสัญชาติ", key="nationality_ot")
     
-    st.session_state.weight = st.number_input("7. น้ำหนัก (kg)", 0.0, step=0.1, key="weight")
-    st.session_state.height = st.number_input("8. ส่วนสูง (cm)", 0.0, step=1.0, key="height")
+    st.number_input("7. น้ำหนัก (kg)", 0.0, step=0.1, key="weight")
+    st.number_input("8. ส่วนสูง (cm)", 0.0, step=1.0, key="height")
     st.markdown('</div>', unsafe_allow_html=True)
+    sync_record()
 
-    # --- Section 2: Medical ---
+# Levels that need a prosthetic knee (item 27)
+KNEE_LEVELS = ["Knee disarticulation", "Transfemoral", "Other"]
+
+def request_app_rerun():
+    st.session_state.app_rerun = True
+
+# --- Section 2: Medical ---
+@st.fragment
+@timed("section_medical")
+def section_medical():
+    # `level` drives the knee field in Section 4, which lives in another fragment
+    if st.session_state.pop('app_rerun', False):
+        st.rerun(scope="app")
     st.markdown('<div class="form-card">', unsafe_allow_html=True)
     st.markdown('<div class="section-title">2. ข้อมูลการตัดขาและสุขภาพ</div>', unsafe_allow_html=True)
     
-    st.session_state.comorbidities = st.multiselect("9. โรคประจำตัว", ["เบาหวาน", "ความดัน", "หัวใจ", "มะเร็ง", "ติดเชื้อ", "ไม่มี", "Other"], key="comorbidities")
-    if "Other" in st.session_state.comorbidities: st.session_state.comorb_ot = st.text_input("ระบุโรค", key="comorb_ot")
+    st.multiselect("9. โรคประจำตัว", OPTIONS['comorbidities'], key="comorbidities")
+    if "Other" in st.session_state.comorbidities: st.text_input("ระบุโรค", key="comorb_ot")
     
-    st.session_state.cause = st.selectbox("10. สาเหตุการตัดขา", ["อุบัติเหตุ", "เบาหวาน", "หลอดเลือด", "มะเร็ง", "ติดเชื้อ", "พิการแต่กำเนิด", "Other"], key="cause")
-    if st.session_state.cause == "Other": st.session_state.cause_ot = st.text_input("ระบุสาเหตุ", key="cause_ot")
+    st.selectbox("10. สาเหตุการตัดขา", OPTIONS['cause'], key="cause")
+    if st.session_state.cause == "Other": st.text_input("ระบุสาเหตุ", key="cause_ot")
     
-    st.session_state.amp_year = st.number_input("11. ปีที่ตัดขา (พ.ศ.)", 2490, 2600, key="amp_year")
-    st.session_state.side = st.radio("12. ข้างที่ตัด", ["ซ้าย", "ขวา", "สองข้าง"], horizontal=True, key="side")
+    st.number_input("11. ปีที่ตัดขา (พ.ศ.)", 2490, 2600, key="amp_year")
+    st.radio("12. ข้างที่ตัด", OPTIONS['side'], horizontal=True, key="side")
     
-    st.session_state.level = st.selectbox("13. ระดับการตัดขา", ["Ankle disarticulation", "Transtibial", "Knee disarticulation", "Transfemoral", "Other"], key="level")
-    if st.session_state.level == "Other": st.session_state.level_ot = st.text_input("ระบุระดับ", key="level_ot")
+    st.selectbox("13. ระดับการตัดขา", OPTIONS['level'], key="level", on_change=request_app_rerun)
+    if st.session_state.level == "Other": st.text_input("ระบุระดับ", key="level_ot")
     
-    st.session_state.stump_len = st.selectbox("14. ความยาวตอขา", ["สั้น", "ปานกลาง", "ยาว"], key="stump_len")
-    st.session_state.stump_shape = st.selectbox("15. รูปทรงตอขา", ["Conical", "Cylindrical", "Bulbous", "Other"], key="stump_shape")
-    if st.session_state.stump_shape == "Other": st.session_state.shape_ot = st.text_input("ระบุรูปทรง", key="shape_ot")
+    st.selectbox("14. ความยาวตอขา", OPTIONS['stump_len'], key="stump_len")
+    st.selectbox("15. รูปทรงตอขา", OPTIONS['stump_shape'], key="stump_shape")
+    if st.session_state.stump_shape == "Other": st.text_input("ระบุรูปทรง", key="shape_ot")
     
-    st.session_state.surgery = st.radio("16. ผ่าตัดเพิ่มเติม", ["ไม่ใช่", "ใช่"], horizontal=True, key="surgery")
+    st.radio("16. ผ่าตัดเพิ่มเติม", OPTIONS['surgery'], horizontal=True, key="surgery")
     if st.session_state.surgery == "ใช่":
-        st.session_state.surg_details = st.multiselect("รายละเอียดการผ่าตัด", ["ตัดกระดูก", "ตัดผิวหนัง", "ตัดระดับสูงขึ้น"], key="surg_details")
+        st.multiselect("รายละเอียดการผ่าตัด", OPTIONS['surg_details'], key="surg_details")
     
-    st.session_state.k_level = st.selectbox("17. K-Level ก่อนตัด", ["K0", "K1", "K2", "K3", "K4"], key="k_level")
+    st.selectbox("17. K-Level ก่อนตัด", OPTIONS['k_level'], key="k_level")
     st.markdown('</div>', unsafe_allow_html=True)
+    sync_record()
 
-    # --- Section 3: Rehab ---
+# --- Section 3: Rehab ---
+@st.fragment
+@timed("section_rehab")
+def section_rehab():
     st.markdown('<div class="form-card">', unsafe_allow_html=True)
     st.markdown('<div class="section-title">3. การฟื้นฟู (Rehab)</div>', unsafe_allow_html=True)
-    st.session_state.personnel = st.multiselect("18. บุคลากรที่ดูแล", ["นักกายอุปกรณ์", "นักกายภาพ", "แพทย์", "พยาบาล", "Other"], key="personnel")
-    if "Other" in st.session_state.personnel: st.session_state.personnel_ot = st.text_input("ระบุบุคลากร", key="personnel_ot")
+    st.multiselect("18. บุคลากรที่ดูแล", OPTIONS['personnel'], key="personnel")
+    if "Other" in st.session_state.personnel: st.text_input("ระบุบุคลากร", key="personnel_ot")
     
-    st.session_state.rehab = st.radio("19. เคยฟื้นฟูหรือไม่", ["ไม่เคย", "เคย"], horizontal=True, key="rehab")
+    st.radio("19. เคยฟื้นฟูหรือไม่", OPTIONS['rehab'], horizontal=True, key="rehab")
     if st.session_state.rehab == "เคย":
-        st.session_state.rehab_act = st.multiselect("กิจกรรม", ["ถุงลดบวม", "ผ้ายืด", "เบ้าซิลิโคน", "ฝึกเดิน", "Other"], key="rehab_act")
-        if "Other" in st.session_state.rehab_act: st.session_state.rehab_act_ot = st.text_input("ระบุกิจกรรม", key="rehab_act_ot")
+        st.multiselect("กิจกรรม", OPTIONS['rehab_act'], key="rehab_act")
+        if "Other" in st.session_state.rehab_act: st.text_input("ระบุกิจกรรม", key="rehab_act_ot")
     st.markdown('</div>', unsafe_allow_html=True)
+    sync_record()
 
-    # --- Section 4: Prosthesis ---
+# --- Section 4: Prosthesis ---
+@st.fragment
+@timed("section_prosthesis")
+def section_prosthesis():
     st.markdown('<div class="form-card">', unsafe_allow_html=True)
     st.markdown('<div class="section-title">4. กายอุปกรณ์ (Prosthesis)</div>', unsafe_allow_html=True)
-    st.session_state.service = st.multiselect("20. การบริการครั้งนี้", ["ทำใหม่", "เปลี่ยนเบ้า", "ซ่อม", "Other"], key="service")
-    if "Other" in st.session_state.service: st.session_state.service_ot = st.text_input("ระบุบริการ", key="service_ot")
+    st.multiselect("20. การบริการครั้งนี้", OPTIONS['service'], key="service")
+    if "Other" in st.session_state.service: st.text_input("ระบุบริการ", key="service_ot")
     
     c1, c2 = st.columns(2)
-    st.session_state.date_cast = c1.date_input("21. วันที่หล่อแบบ", key="date_cast")
-    st.session_state.date_deliv = c2.date_input("22. วันที่ได้รับ", key="date_deliv")
+    c1.date_input("21. วันที่หล่อแบบ", key="date_cast")
+    c2.date_input("22. วันที่ได้รับ", key="date_deliv")
     
-    st.session_state.socket = st.selectbox("23. Socket Type", ["PTB", "TSB", "KBM", "Quadrilateral", "Ischial Containment", "Other"], key="socket")
-    if st.session_state.socket == "Other": st.session_state.socket_ot = st.text_input("ระบุ Socket", key="socket_ot")
+    st.selectbox("23. Socket Type", OPTIONS['socket'], key="socket")
+    if st.session_state.socket == "Other": st.text_input("ระบุ Socket", key="socket_ot")
     
-    st.session_state.liner = st.selectbox("24. Liner", ["None", "Foam", "Silicone", "Gel", "Other"], key="liner")
-    if st.session_state.liner == "Other": st.session_state.liner_ot = st.text_input("ระบุ Liner", key="liner_ot")
+    st.selectbox("24. Liner", OPTIONS['liner'], key="liner")
+    if st.session_state.liner == "Other": st.text_input("ระบุ Liner", key="liner_ot")
     
-    st.session_state.suspension = st.multiselect("25. Suspension", ["Cuff", "Pin Lock", "Suction", "Vacuum", "Belt", "Other"], key="suspension")
-    if "Other" in st.session_state.suspension: st.session_state.susp_ot = st.text_input("ระบุ Suspension", key="susp_ot")
+    st.multiselect("25. Suspension", OPTIONS['suspension'], key="suspension")
+    if "Other" in st.session_state.suspension: st.text_input("ระบุ Suspension", key="susp_ot")
     
-    st.session_state.foot = st.multiselect("26. Foot", ["SACH", "Single Axis", "Dynamic", "Microprocessor", "Other"], key="foot")
-    if "Other" in st.session_state.foot: st.session_state.foot_ot = st.text_input("ระบุ Foot", key="foot_ot")
+    st.multiselect("26. Foot", OPTIONS['foot'], key="foot")
+    if "Other" in st.session_state.foot: st.text_input("ระบุ Foot", key="foot_ot")
     
-    st.session_state.knee = st.multiselect("27. Knee (สำหรับเหนือเข่า)", ["Single Axis", "Polycentric", "Hydraulic", "Microprocessor", "Other"], key="knee")
-    if "Other" in st.session_state.knee: st.session_state.knee_ot = st.text_input("ระบุ Knee", key="knee_ot")
+    if st.session_state.level in KNEE_LEVELS:
+        st.multiselect("27. Knee (สำหรับเหนือเข่า)", OPTIONS['knee'], key="knee")
+        if "Other" in st.session_state.knee: st.text_input("ระบุ Knee", key="knee_ot")
     st.markdown('</div>', unsafe_allow_html=True)
+    sync_record()
 
-    # --- Section 5: Social ---
+# --- Section 5: Social ---
+@st.fragment
+@timed("section_social")
+def section_social():
     st.markdown('<div class="form-card">', unsafe_allow_html=True)
     st.markdown('<div class="section-title">5. สังคมและการใช้งาน</div>', unsafe_allow_html=True)
-    st.session_state.assist = st.selectbox("28. อุปกรณ์ช่วยเดิน", ["ไม่ใช้", "ไม้เท้า", "Walker", "Wheelchair", "Other"], key="assist")
-    if st.session_state.assist == "Other": st.session_state.assist_ot = st.text_input("ระบุอุปกรณ์", key="assist_ot")
+    st.selectbox("28. อุปกรณ์ช่วยเดิน", OPTIONS['assist'], key="assist")
+    if st.session_state.assist == "Other": st.text_input("ระบุอุปกรณ์", key="assist_ot")
     
-    st.session_state.stand_hr = st.selectbox("29.1 เวลายืนต่อวัน", ["ไม่ยืน", "< 1 ชม.", "1-3 ชม.", "3-7 ชม.", "> 8 ชม."], key="stand_hr")
-    st.session_state.walk_hr = st.selectbox("29.2 เวลาเดินต่อวัน", ["ไม่เดิน", "< 1 ชม.", "1-3 ชม.", "3-7 ชม.", "> 8 ชม."], key="walk_hr")
+    st.selectbox("29.1 เวลายืนต่อวัน", OPTIONS['stand_hr'], key="stand_hr")
+    st.selectbox("29.2 เวลาเดินต่อวัน", OPTIONS['walk_hr'], key="walk_hr")
     
-    st.session_state.fall = st.radio("30. ประวัติล้ม (6 เดือน)", ["ไม่", "มี"], horizontal=True, key="fall")
+    st.radio("30. ประวัติล้ม (6 เดือน)", OPTIONS['fall'], horizontal=True, key="fall")
     if st.session_state.fall == "มี":
-        st.session_state.fall_freq = st.selectbox("ความถี่การล้ม", ["< 1 ครั้ง", "1-2 ครั้ง", "3-4 ครั้ง", "> 4 ครั้ง"], key="fall_freq")
-        st.session_state.fall_inj = st.radio("บาดเจ็บหรือไม่", ["ไม่", "ใช่"], horizontal=True, key="fall_inj")
+        st.selectbox("ความถี่การล้ม", OPTIONS['fall_freq'], key="fall_freq")
+        st.radio("บาดเจ็บหรือไม่", OPTIONS['fall_inj'], horizontal=True, key="fall_inj")
     
     st.markdown("---")
-    probs = ["ไม่มีปัญหา (0-4%)", "เล็กน้อย (5-24%)", "ปานกลาง (25-49%)", "มาก (50-95%)", "มากที่สุด (96-100%)"]
-    st.session_state.q31_1 = st.selectbox("31.1 ปัญหาสังคม (เทียบตนเอง)", probs, key="q31_1")
-    st.session_state.q31_2 = st.selectbox("31.2 ปัญหาสังคม (เทียบคนอื่น)", probs, key="q31_2")
-    st.session_state.q32_1 = st.selectbox("32.1 ปัญหางาน (เทียบตนเอง)", probs, key="q32_1")
-    st.session_state.q32_2 = st.selectbox("32.2 ปัญหางาน (เทียบคนอื่น)", probs, key="q32_2")
+    st.selectbox("31.1 ปัญหาสังคม (เทียบตนเอง)", OPTIONS['q31_1'], key="q31_1")
+    st.selectbox("31.2 ปัญหาสังคม (เทียบคนอื่น)", OPTIONS['q31_2'], key="q31_2")
+    st.selectbox("32.1 ปัญหางาน (เทียบตนเอง)", OPTIONS['q32_1'], key="q32_1")
+    st.selectbox("32.2 ปัญหางาน (เทียบคนอื่น)", OPTIONS['q32_2'], key="q32_2")
     
     st.markdown("---")
-    st.session_state.supp_fam = st.radio("33.1 การดูแลจากครอบครัว", ["ใช่", "ไม่ใช่"], horizontal=True, key="supp_fam")
-    st.session_state.supp_org = st.radio("33.2 สนับสนุนจากองค์กร", ["ไม่ใช่", "ใช่"], horizontal=True, key="supp_org")
+    st.radio("33.1 การดูแลจากครอบครัว", OPTIONS['supp_fam'], horizontal=True, key="supp_fam")
+    st.radio("33.2 สนับสนุนจากองค์กร", OPTIONS['supp_org'], horizontal=True, key="supp_org")
     if st.session_state.supp_org == "ใช่":
-        st.session_state.supp_src = st.multiselect("ระบุองค์กร", ["รัฐ", "ไม่แสวงหากำไร", "จ่ายเอง", "Other"], key="supp_src")
-        if "Other" in st.session_state.supp_src: st.session_state.supp_src_ot = st.text_input("ระบุองค์กรอื่น", key="supp_src_ot")
+        st.multiselect("ระบุองค์กร", OPTIONS['supp_src'], key="supp_src")
+        if "Other" in st.session_state.supp_src: st.text_input("ระบุองค์กรอื่น", key="supp_src_ot")
     st.markdown('</div>', unsafe_allow_html=True)
+    sync_record()
 
 # === TAB 2: TUG TEST ===
-with tab2:
+TUG_POLL_SECONDS = 0.05
+
+def start_tug():
+    st.session_state.start_time = time.time()
+    st.session_state.tug_running = True
+
+def stop_tug():
+    st.session_state.tug_running = False
+    if st.session_state.start_time is not None:
+        add_trial(time.time() - st.session_state.start_time)
+
+# Server-mode clock: only rendered while running, and only this fragment polls.
+# No st.rerun(scope="fragment") loop here: that call raises whenever the tab is
+# drawn by a full-app run (a sidebar click while the timer runs).
+@st.fragment(run_every=TUG_POLL_SECONDS)
+@timed("tug_clock")
+def tug_clock():
+    if not st.session_state.tug_running or st.session_state.start_time is None:
+        return  # a tick already queued when STOP / Reset landed
+    elapsed = time.time() - st.session_state.start_time
+    st.markdown(f'<div class="tug-display">{elapsed:.2f} s</div>', unsafe_allow_html=True)
+
+# Its own fragment too, so START/STOP and the trials only rerun this tab
+@st.fragment
+@timed("tug_tab")
+def tug_tab():
     st.markdown('<div class="form-card" style="text-align:center;">', unsafe_allow_html=True)
     st.markdown('<div class="section-title" style="text-align:center; border:none;">⏱️ Timed Up and Go Test</div>', unsafe_allow_html=True)
     
-    if st.session_state.tug_running:
-        elapsed = time.time() - st.session_state.start_time
-        st.markdown(f'<div class="tug-display">{elapsed:.2f} s</div>', unsafe_allow_html=True)
-        if st.button("⏹️ STOP", type="primary", use_container_width=True):
-            st.session_state.tug_running = False
-            fin = elapsed
-            if st.session_state.t1 == 0: st.session_state.t1 = fin
-            elif st.session_state.t2 == 0: st.session_state.t2 = fin
-            elif st.session_state.t3 == 0: st.session_state.t3 = fin
-            calculate_tug()
-            st.rerun()
-        time.sleep(0.05)
-        st.rerun()
+    st.radio("โหมดจับเวลา", ["Browser", "Server"], horizontal=True, key="tug_mode",
+             help="Browser: จับเวลาบนเครื่องผู้ใช้ ไม่ส่งข้อมูลระหว่างจับเวลา")
+
+    if st.session_state.tug_mode == "Browser":
+        tug_timer(key="tug_browser", on_change=record_tug_browser, default=None)
+    elif st.session_state.tug_running:
+        tug_clock()
+        st.button("⏹️ STOP", key="tug_stop", type="primary", on_click=stop_tug, width="stretch")
     else:
         st.markdown(f'<div class="tug-display" style="color:#ccc;">0.00 s</div>', unsafe_allow_html=True)
-        if st.button("▶️ START", type="primary", use_container_width=True):
-            st.session_state.start_time = time.time()
-            st.session_state.tug_running = True
-            st.rerun()
+        st.button("▶️ START", key="tug_start", type="primary", on_click=start_tug, width="stretch")
     
     st.markdown("---")
     c1, c2, c3 = st.columns(3)
-    st.session_state.t1 = c1.number_input("Trial 1", value=st.session_state.t1, on_change=calculate_tug)
-    st.session_state.t2 = c2.number_input("Trial 2", value=st.session_state.t2, on_change=calculate_tug)
-    st.session_state.t3 = c3.number_input("Trial 3", value=st.session_state.t3, on_change=calculate_tug)
+    c1.number_input("Trial 1", key="t1", on_change=calculate_tug)
+    c2.number_input("Trial 2", key="t2", on_change=calculate_tug)
+    c3.number_input("Trial 3", key="t3", on_change=calculate_tug)
     
-    st.button("🔄 Reset Timer", on_click=reset_tug, use_container_width=True)
+    st.button("🔄 Reset Timer", on_click=reset_tug, width="stretch")
     
     if st.session_state.tug_avg > 0:
-        bg = "#C0392B" if st.session_state.tug_avg >= 13.5 else "#27AE60"
+        bg = "#C0392B" if st.session_state.tug_avg >= TUG_THRESHOLD else "#27AE60"
         st.markdown(f"""
         <div class="result-box" style="background:{bg};">
             <div>Average Time: {st.session_state.tug_avg:.2f} s</div>
             <div style="font-size:1.5em; margin-top:5px;">{st.session_state.tug_status}</div>
         </div>
         """, unsafe_allow_html=True)
-    st.markdown('</div>', unsafe_allow_html=True)
\ No newline at end of file
+    st.markdown('</div>', unsafe_allow_html=True)
+    sync_record()
+
+# --- TUG history for the current HN ---
+def get_tug_history(hn):
+    # One blob read per HN; kept in the session until the next append
+    if st.session_state.get('tug_hist_hn') != hn:
+        st.session_state.tug_hist = unpack_history(get_store().load_tug(hn))
+        st.session_state.tug_hist_hn = hn
+    return st.session_state.tug_hist
+
+def save_tug_session_cb():
+    hn = st.session_state.hn
+    trials = [st.session_state.t1, st.session_state.t2, st.session_state.t3]
+    if not hn or not any(t > 0 for t in trials):
+        st.toast("ต้องมี HN และผลทดสอบอย่างน้อย 1 ครั้ง", icon="⚠️")
+        return
+    get_store().append_tug(hn, pack_session(time.time(), trials))
+    st.session_state.tug_hist_hn = None
+    st.toast("บันทึกผล TUG แล้ว", icon="✅")
+
+@st.fragment
+@timed("tug_history_panel")
+def tug_history_panel():
+    st.button("📈 Save TUG Session", key="tug_save_btn", on_click=save_tug_session_cb, width="stretch")
+    hn = st.session_state.hn
+    if not hn:
+        return
+    trend = tug_trends(get_tug_history(hn))
+    if trend is None:
+        st.caption(f"ยังไม่มีประวัติ TUG ของ HN {hn}")
+        return
+    st.markdown(f"#### ประวัติ TUG ({trend['sessions']} ครั้ง)")
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("Baseline", f"{trend['baseline']:.2f} s")
+    m2.metric("Latest", f"{trend['latest']:.2f} s", f"{trend['change']:+.2f} s", delta_color="inverse")
+    m3.metric("Slope", f"{trend['slope_per_year']:+.2f} s/yr")
+    m4.metric(f"≥ {TUG_THRESHOLD} s", f"{trend['high_risk_sessions']}/{trend['sessions']}",
+              f"{trend['crossings']} crossings", delta_color="off")
+    st.line_chart({'date': trend['ts'].astype('datetime64[s]'), 'TUG avg (s)': trend['avgs']}, x='date')
+
+# === TAB 3: COHORT DASHBOARD ===
+@st.fragment
+@timed("cohort_tab")
+def cohort_tab():
+    cohort = get_cohort()
+    f1, f2 = st.columns(2)
+    provinces = f1.multiselect("จังหวัด", cohort.provinces(), key="cohort_prov")
+    dates = f2.date_input("ช่วงวันที่ได้รับกายอุปกรณ์", value=(), key="cohort_dates")
+    date_from = dates[0] if len(dates) > 0 else None
+    date_to = dates[1] if len(dates) > 1 else None
+    summ = cohort.summary(provinces, date_from, date_to)
+    st.caption(f"จำนวนผู้ป่วย: {summ['n']:,} ราย")
+    if summ['n'] == 0:
+        return
+
+    c1, c2 = st.columns(2)
+    c1.markdown("**สาเหตุการตัดขา × ระดับ (cause × level)**")
+    c1.bar_chart(summ['cause_level'])
+    c2.markdown("**K-Level vs TUG เฉลี่ย**")
+    c2.bar_chart(summ['k_tug']['tug_avg'])
+    c2.dataframe(summ['k_tug'], width="stretch")
+
+    c3, c4 = st.columns(2)
+    c3.markdown("**ประวัติล้ม × อุปกรณ์ช่วยเดิน**")
+    c3.dataframe(summ['fall_assist'], width="stretch")
+    c4.markdown("**การใช้ชิ้นส่วนกายอุปกรณ์**")
+    c4.dataframe(summ['components'], width="stretch")
+
+tab1, tab2, tab3 = st.tabs(["📝 Registry Form", "⏱️ TUG Test", "📊 Cohort"])
+
+with tab1:
+    section_general()
+    section_medical()
+    section_rehab()
+    section_prosthesis()
+    section_social()
+
+with tab2:
+    tug_tab()
+    tug_history_panel()
+
+with tab3:
+    cohort_tab()
+
+end_run()
@@ -0,0 +1,46 @@
+import numpy as np
+
+# ---------------------------------------------------------
+# TUG history: packed float64 rows of [timestamp, t1, t2, t3]
+# ---------------------------------------------------------
+TUG_THRESHOLD = 13.5  # seconds; >= is high fall risk
+ROW_WIDTH = 4
+DTYPE = '<f8'
+MIN_SLOPE_DAYS = 30  # shorter spans give meaningless s/year slopes
+
+def pack_session(ts, trials):
+    # Missing trials (0) are stored as NaN so they drop out of the means
+    row = np.array([ts] + [t if t > 0 else np.nan for t in trials], dtype=DTYPE)
+    return row.tobytes()
+
+def unpack_history(blob):
+    if not blob:
+        return np.empty((0, ROW_WIDTH), dtype=DTYPE)
+    return np.frombuffer(blob, dtype=DTYPE).reshape(-1, ROW_WIDTH)
+
+def tug_trends(hist):
+    # All per-session maths is vectorized over the whole history
+    valid = ~np.isnan(hist[:, 1:]).all(axis=1)
+    hist = hist[valid]
+    n = len(hist)
+    if n == 0:
+        return None
+    ts = hist[:, 0]
+    avgs = np.nanmean(hist[:, 1:], axis=1)
+    risk = avgs >= TUG_THRESHOLD
+    if n > 1 and ts[-1] - ts[0] >= MIN_SLOPE_DAYS * 86400:
+        years = (ts - ts[0]) / (365.25 * 86400)
+        slope = np.polyfit(years, avgs, 1)[0]
+    else:
+        slope = 0.0
+    return {
+        'sessions': n,
+        'ts': ts,
+        'avgs': avgs,
+        'baseline': avgs[0],
+        'latest': avgs[-1],
+        'change': avgs[-1] - avgs[0],
+        'slope_per_year': float(slope),
+        'high_risk_sessions': int(risk.sum()),
+        'crossings': int(np.count_nonzero(np.diff(risk.astype(np.int8)))),
+    }